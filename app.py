@@ -1,11 +1,112 @@
 # app.py
 import streamlit as st
 import io
-from extraction import extract_data_from_pdf, validate_client_info
-from excel_generator import load_template_workbook, fill_excel_workbook, fill_excel_workbook_addition
-from openpyxl import load_workbook
+import time
+from instrumentation import configure_logging, trace, emit, timings_table
 import config
-from openpyxl.styles import Alignment
+
+# Démarrage : seuls Streamlit et la configuration sont chargés ici ; les modules lourds (PyMuPDF, pdfplumber,
+# openpyxl, NumPy) sont importés dans la branche du mode qui en a besoin, une seule fois par processus.
+
+def show_file_result(slot, idx, result):
+    # Affiche le résultat d'un fichier à son emplacement dès la fin de son analyse
+    if result["error"]:
+        slot.error(f"Échec de l'extraction du fichier {result['name']} : {result['error']}")
+        return
+    data = result["data"]
+    with slot.container():
+        with st.expander(f"Fichier {idx + 1} : {result['name']}", expanded=False):
+            st.write(f"**Nom du client :** {data.get('Nom du client', '')}")
+            st.write(f"**Comptes clients :** {', '.join(data.get('Comptes clients', [])) if data.get('Comptes clients') else 'Non trouvé'}")
+            st.write(f"**Produit concerné :** {data.get('Produit concerné', 'Non reconnu')}")
+            st.write(f"**Année :** {data.get('Année', 'Non reconnue')}")
+            st.write(f"**NB Dossier :** {data.get('RC', 0)}")
+            st.write(f"**TONNAGE :** {data.get('Tonnage', 0)}")
+            st.write(f"**CA HT Facturé :** {data.get('CA', 0.0)}")
+            st.write(f"**Moteur d'extraction :** {data.get('Moteur', 'pdfplumber')}{' (repli)' if data.get('Repli') else ''}")
+
+def submit_job(kind, files, params=None):
+    # Une seule tâche par envoi : les réexécutions du script suivent la tâche déjà déposée
+    from jobs import get_default_queue
+    signature = (kind, tuple(getattr(f, "file_id", None) or f.name for f in files), repr(sorted((params or {}).items())))
+    submitted = st.session_state.setdefault("submitted_jobs", {})
+    if signature not in submitted:
+        submitted[signature] = get_default_queue().submit(kind, files, params)
+    return submitted[signature]
+
+def follow_job(job_id):
+    # État d'une tâche du service (jobs.py) puis téléchargement de ses classeurs ; le script se relance tant que
+    # la tâche n'est pas terminée, le traitement se poursuit même si la page est fermée
+    from jobs import get_default_queue, FINAL_STATUSES
+    queue = get_default_queue()
+    job = queue.get(job_id)
+    if job is None:
+        st.error(f"Tâche inconnue : {job_id}")
+        return
+    st.caption(f"Identifiant de la tâche (pour la retrouver plus tard) : {job_id}")
+    if job["status"] not in FINAL_STATUSES:
+        if job["status"] == "queued":
+            text = "En attente d'un processus de traitement..."
+        else:
+            text = f"{job['progress']}/{job['total']} fichier(s) traité(s)"
+        st.progress(job["progress"] / job["total"] if job["total"] else 0.0, text=text)
+        time.sleep(config.JOB_POLL_INTERVAL_S)
+        st.rerun()
+    if job["status"] == "error":
+        st.error(f"Une erreur s'est produite lors du traitement : {job['error']}")
+        return
+    if job["status"] == "cancelled":
+        st.warning("Traitement annulé.")
+        return
+    summary = job["summary"] or {}
+    if summary.get("errors"):
+        st.warning(f"{summary['errors']} fichier(s) n'ont pas pu être analysés.")
+    outputs = queue.outputs(job_id)
+    st.success(f"Traitement terminé : {len(outputs)} classeur(s) généré(s).")
+    if len(outputs) == 1:
+        filename, _ = outputs[0]
+        st.download_button(
+            label="Télécharger le fichier Excel",
+            data=queue.read_output(job_id, filename),
+            file_name=filename,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    elif outputs:
+        archive = io.BytesIO()
+        queue.write_archive(job_id, archive)
+        st.download_button(label="Télécharger les rapports", data=archive.getvalue(),
+                           file_name="ANALYSES DES FLUX.zip", mime="application/zip")
+
+def show_profile(pipeline, files, period=None):
+    # Traitement rejoué sous cProfile (profiling.py) : fonctions les plus coûteuses par étape et profil
+    # téléchargeable ; conservé pour la session tant que les fichiers et la période ne changent pas
+    from profiling import profile_pdf, profile_addition
+    signature = (pipeline, tuple(getattr(f, "file_id", None) or f.name for f in files), period)
+    profile = st.session_state.get("profile")
+    if profile is None or profile[0] != signature:
+        with st.spinner("Profilage du traitement..."):
+            profiler, record = profile_pdf(files, period) if pipeline == "pdf" else profile_addition(files)
+        profile = st.session_state["profile"] = (signature, profiler.hot_functions(), profiler.summary(),
+                                                 profiler.dump(), record)
+    _, hot_functions, summary, content, record = profile
+    st.subheader("Profil du traitement")
+    st.caption(f"Traitement rejoué en {record['total_ms'] / 1000:.2f} s dans le processus de l'application, sans pool ni cache")
+    st.dataframe(hot_functions)
+    col1, col2 = st.columns(2)
+    col1.download_button("Télécharger le profil (.prof)", data=content, file_name=f"profil_{pipeline}.prof",
+                         mime="application/octet-stream")
+    col2.download_button("Télécharger le résumé par étape", data=summary, file_name=f"profil_{pipeline}.txt",
+                         mime="text/plain")
+
+def offer_export(records):
+    # Chiffres agrégés en table à plat (export.py) pour les traitements BI, produits seulement sur demande
+    choice = st.selectbox("Exporter aussi les chiffres (table à plat)", options=["Non", "CSV", "Parquet"])
+    if choice == "Non":
+        return
+    from export import MIME_TYPES, export_bytes, export_filename
+    output_format = choice.lower()
+    st.download_button(label=f"Télécharger les chiffres ({choice})", data=export_bytes(records, output_format),
+                       file_name=export_filename("ANALYSES DES FLUX", output_format), mime=MIME_TYPES[output_format])
 
 def format_date_field(key):
     val = st.session_state.get(key, "")
@@ -16,8 +117,19 @@ def format_date_field(key):
     st.session_state[key] = formatted
 
 st.set_page_config(page_title="Extraction et Addition Excel", layout="wide")
+configure_logging()
 
-mode = st.radio("Sélectionnez le mode", options=["Extraction depuis PDF", "Addition de fichiers Excel"])
+if config.JOB_QUEUE_ENABLED:
+    job_lookup = st.sidebar.text_input("Retrouver une tâche (identifiant)", "").strip()
+    if job_lookup:
+        st.title("Suivi d'une tâche")
+        follow_job(job_lookup)
+        st.stop()
+
+# Profilage à la demande : sans la case cochée, aucun profileur n'est installé
+profile_run = config.PROFILING_UI and st.sidebar.checkbox("Profiler le traitement (rejoué, plus lent)")
+
+mode = st.radio("Sélectionnez le mode", options=["Extraction depuis PDF", "Addition de fichiers Excel", "Rapport depuis la base"])
 
 if mode == "Extraction depuis PDF":
     st.title("Extraction Automatisée de Données PDF vers Excel")
@@ -48,6 +160,7 @@ if mode == "Extraction depuis PDF":
     clear = st.button("Clear Files")
     if clear:
         st.session_state.file_uploader_key = st.session_state.get("file_uploader_key", 0) + 1
+        st.session_state.pop("pdf_report", None)
         uploader_container.empty()
         uploader_container.file_uploader(
             "Drag and drop files here (Limit 200MB per file • PDF)",
@@ -62,80 +175,169 @@ if mode == "Extraction depuis PDF":
     if not uploaded_files:
         st.warning("Veuillez télécharger au moins un fichier PDF.")
         st.stop()
-    if len(uploaded_files) > 12:
-        st.error("Vous pouvez télécharger au maximum 12 fichiers PDF.")
+    if config.JOB_QUEUE_ENABLED:
+        # Traitement confié au service de tâches : la page ne fait qu'en suivre l'avancement
+        follow_job(submit_job("extraction", uploaded_files, {"period": period_string}))
         st.stop()
+    # Moteurs d'extraction chargés au premier envoi de fichiers, pas à l'affichage de la page
+    from extraction import validate_client_info
+    from pipeline import backend_summary, upload_limit, client_key, SharedPool
+    from incremental import IncrementalReport
     
-    with st.spinner("Traitement des fichiers PDF..."):
-        try:
-            extracted_data = []
-            for pdf_file in uploaded_files:
-                data, _ = extract_data_from_pdf(pdf_file, period=period_string)
-                extracted_data.append(data)
-            
-            client_info = {
-                "Nom du client": extracted_data[0].get("Nom du client", ""),
-                "Comptes clients": extracted_data[0].get("Comptes clients", []),
-                "Périodicité": period_string
-            }
-            
-            st.subheader("Informations du Client Confirmées")
-            st.write(f"**Nom du client :** {client_info['Nom du client']}")
-            st.write(f"**Comptes clients :** {', '.join(client_info['Comptes clients']) if client_info['Comptes clients'] else 'Non trouvé'}")
-            st.write(f"**Périodicité :** {client_info['Périodicité']}")
+    max_files = upload_limit()
+    if len(uploaded_files) > max_files:
+        st.error(f"Vous pouvez télécharger au maximum {max_files} fichiers PDF "
+                 f"(environ {config.UPLOAD_TIME_BUDGET_S} s de traitement au débit mesuré).")
+        st.stop()
+    
+    try:
+        state = st.session_state.setdefault("pdf_report", IncrementalReport())
+        start = time.perf_counter()
+        with trace("pdf_run", files=len(uploaded_files)) as run_trace:
+            # Les fichiers partent dans le pool de processus ; chaque résultat s'affiche dès qu'il est prêt
+            nb_parsed = state.submit(uploaded_files, period_string)
+            summary_container = st.container()
+            nb_files = len(uploaded_files)
+            progress = st.progress(0.0, text="Traitement des fichiers PDF...")
+            st.markdown("### Détails des fichiers")
+            slots = [st.empty() for _ in uploaded_files]
+            completed = state.completed()
+            for idx, pdf_file in enumerate(uploaded_files):
+                if idx in completed:
+                    show_file_result(slots[idx], idx, completed[idx])
+                else:
+                    slots[idx].caption(f"Fichier {idx + 1} : {pdf_file.name} — en cours...")
+            nb_done = len(completed)
+            progress.progress(nb_done / nb_files, text=f"{nb_done}/{nb_files} fichier(s) traité(s)")
+            for idx, result in state.iter_completed():
+                show_file_result(slots[idx], idx, result)
+                nb_done += 1
+                progress.progress(nb_done / nb_files, text=f"{nb_done}/{nb_files} fichier(s) traité(s)")
+            results = state.finalize()
+        elapsed = time.perf_counter() - start
+        progress.empty()
+        file_metrics = [result["metrics"] for result in results]
+        
+        with summary_container:
+            results = [result for result in results if result["error"] is None]
+            if not results:
+                st.error("Aucun fichier PDF n'a pu être traité.")
+                st.stop()
+            extracted_data = [result["data"] for result in results]
+            nb_cached = sum(1 for result in results if result["cached"] or result["duplicate"])
+            st.caption(f"{len(results)} fichier(s) traité(s) en {elapsed:.2f} s ({nb_parsed} nouveau(x), {nb_cached} depuis le cache ou en doublon)")
+            summary = backend_summary(results)
+            st.caption("Moteurs : " + ", ".join(f"{name} ({count})" for name, count in summary["backends"].items())
+                       + f" — replis sur pdfplumber : {summary['fallbacks']} ({summary['fallback_rate']:.0%})")
             
-            data_par_produit = {}
             for data in extracted_data:
-                produit = data.get("Produit concerné")
-                annee = data.get("Année")
-                if not produit or not annee:
+                if not data.get("Produit concerné") or not data.get("Année"):
                     st.warning(f"Produit ou année non reconnu dans le fichier {data.get('Nom du client', 'Unknown')}.")
-                    continue
-                if produit not in data_par_produit:
-                    data_par_produit[produit] = {}
-                if annee not in data_par_produit[produit]:
-                    data_par_produit[produit][annee] = {"RC": 0, "Tonnage": 0, "CA": 0}
-                data_par_produit[produit][annee]["RC"] += data.get("RC", 0)
-                data_par_produit[produit][annee]["Tonnage"] += data.get("Tonnage", 0)
-                data_par_produit[produit][annee]["CA"] += data.get("CA", 0.0)
             
             valid, error_msg = validate_client_info(extracted_data)
             if not valid:
-                st.error(error_msg)
-                st.stop()
-            
-            wb = load_template_workbook()
-            wb = fill_excel_workbook(wb, data_par_produit, client_info)
-            if wb is None:
-                st.error("Erreur lors de la création du classeur Excel.")
-                st.stop()
-            
-            excel_buffer = io.BytesIO()
-            wb.save(excel_buffer)
-            excel_buffer.seek(0)
-            
-            st.success("Le fichier Excel a été généré avec succès !")
-            st.download_button(
-                label="Télécharger le fichier Excel",
-                data=excel_buffer,
-                file_name=f"ANALYSES DES FLUX {client_info['Nom du client']}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-            
-            st.markdown("### Détails des fichiers")
-            for idx, data in enumerate(extracted_data):
-                with st.expander(f"Fichier {idx + 1} : {uploaded_files[idx].name}", expanded=False):
-                    st.write(f"**Nom du client :** {data.get('Nom du client', '')}")
-                    st.write(f"**Comptes clients :** {', '.join(data.get('Comptes clients', [])) if data.get('Comptes clients') else 'Non trouvé'}")
-                    st.write(f"**Produit concerné :** {data.get('Produit concerné', 'Non reconnu')}")
-                    st.write(f"**Année :** {data.get('Année', 'Non reconnue')}")
-                    st.write(f"**NB Dossier :** {data.get('RC', 0)}")
-                    st.write(f"**TONNAGE :** {data.get('Tonnage', 0)}")
-                    st.write(f"**CA HT Facturé :** {data.get('CA', 0.0)}")
-        except Exception as e:
-            st.error(f"Une erreur s'est produite lors du traitement : {e}")
+                from multi_client import client_jobs, generate_reports, write_zip, multi_sheet_workbook
+                # Envoi mélangeant plusieurs clients : un classeur par client, dans une archive ZIP ou en feuilles
+                clients = list(dict.fromkeys(client_key(data) for data in extracted_data))
+                st.subheader(f"Plusieurs clients détectés ({len(clients)})")
+                st.write(error_msg)
+                for client_name, accounts in clients:
+                    st.write(f"- **{client_name or 'Client inconnu'}** : {', '.join(accounts) if accounts else 'Non trouvé'}")
+                output_format = st.radio("Format de sortie", options=["Archive ZIP (un classeur par client)", "Un classeur (une feuille par client)"])
+                jobs = client_jobs(state.records.by_client(), period_string, clients)
+                with trace("multi_client_report", clients=len(jobs)) as report_trace:
+                    if output_format.startswith("Archive"):
+                        zip_buffer = io.BytesIO()
+                        write_zip(generate_reports(jobs, executor=SharedPool()), zip_buffer)
+                        download = {"data": zip_buffer.getvalue(), "file_name": "ANALYSES DES FLUX.zip", "mime": "application/zip"}
+                    else:
+                        download = {"data": multi_sheet_workbook(jobs), "file_name": "ANALYSES DES FLUX multi-clients.xlsx",
+                                    "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+                run_record = run_trace.record()
+                run_record["new_files"] = nb_parsed
+                emit(run_record)
+                emit(report_trace.record())
+                st.success(f"{len(jobs)} rapports clients générés avec succès !")
+                st.download_button(label="Télécharger les rapports", **download)
+                offer_export(state.records)
+            else:
+                client_info = {
+                    "Nom du client": extracted_data[0].get("Nom du client", ""),
+                    "Comptes clients": extracted_data[0].get("Comptes clients", []),
+                    "Périodicité": period_string
+                }
+                
+                st.subheader("Informations du Client Confirmées")
+                st.write(f"**Nom du client :** {client_info['Nom du client']}")
+                st.write(f"**Comptes clients :** {', '.join(client_info['Comptes clients']) if client_info['Comptes clients'] else 'Non trouvé'}")
+                st.write(f"**Périodicité :** {client_info['Périodicité']}")
+                
+                with trace("report", client=client_info["Nom du client"]) as report_trace:
+                    excel_buffer = io.BytesIO(state.workbook(client_info))
+                run_record = run_trace.record()
+                run_record["new_files"] = nb_parsed
+                emit(run_record)
+                emit(report_trace.record())
+                
+                st.success("Le fichier Excel a été généré avec succès !")
+                st.download_button(
+                    label="Télécharger le fichier Excel",
+                    data=excel_buffer,
+                    file_name=f"ANALYSES DES FLUX {client_info['Nom du client']}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+                offer_export(state.records)
+        
+        if st.checkbox("Afficher les temps de traitement"):
+            st.dataframe(timings_table(file_metrics + [run_record, report_trace.record()]))
+    except Exception as e:
+        st.error(f"Une erreur s'est produite lors du traitement : {e}")
+    if profile_run:
+        show_profile("pdf", uploaded_files, period_string)
+
+elif mode == "Rapport depuis la base":
+    from store import get_default_store
+    from multi_client import output_filename
+    
+    st.title("Rapport depuis la base des chiffres extraits")
+    st.write("Cette option produit le rapport d'un client pour n'importe quelle période à partir des chiffres déjà extraits, sans renvoyer les PDF.")
+    
+    store = get_default_store(create=False)
+    stored_clients = store.clients() if store is not None else []
+    if not stored_clients:
+        st.info("Aucun chiffre enregistré : analysez d'abord des fichiers PDF.")
+        st.stop()
+    selected = st.selectbox("Client", options=stored_clients,
+                            format_func=lambda c: f"{c[0]} [{', '.join(c[1])}] — {c[2]} fichier(s), années {', '.join(c[3])}")
+    
+    st.subheader("Définissez la période d'analyse (format mm/aaaa)")
+    col1, col2, col3, col4 = st.columns(4)
+    date1 = col1.text_input("Du (mm/aaaa)", "", key="store_date1", on_change=lambda: format_date_field("store_date1"))
+    date2 = col2.text_input("Au (mm/aaaa)", "", key="store_date2", on_change=lambda: format_date_field("store_date2"))
+    date3 = col3.text_input("Et du (mm/aaaa)", "", key="store_date3", on_change=lambda: format_date_field("store_date3"))
+    date4 = col4.text_input("Au (mm/aaaa)", "", key="store_date4", on_change=lambda: format_date_field("store_date4"))
+    if not (date1 and date2 and date3 and date4):
+        st.info("Veuillez remplir toutes les cases pour définir la période.")
+        st.stop()
+    
+    try:
+        client_name, accounts = selected[0], selected[1]
+        with trace("store_report", client=client_name) as report_trace:
+            content = store.report(client_name, accounts, f"Du {date1} au {date2} et du {date3} au {date4}")
+        emit(report_trace.record())
+        st.caption(f"Rapport généré en {report_trace.record()['total_ms']:.0f} ms")
+        st.download_button(
+            label="Télécharger le fichier Excel",
+            data=content,
+            file_name=output_filename(client_name, accounts),
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    except Exception as e:
+        st.error(f"Une erreur s'est produite lors de la génération du rapport : {e}")
 
 else:
+    from excel_reader import combined_report
+    
     st.title("Addition de Fichiers Excel")
     st.write("Cette option vous permet de combiner les données de plusieurs fichiers Excel (templates préremplis) en additionnant uniquement les cellules à l'intérieur des tableaux.")
     
@@ -164,92 +366,15 @@ else:
     if not excel_files:
         st.warning("Veuillez télécharger au moins un fichier Excel.")
         st.stop()
+    if config.JOB_QUEUE_ENABLED:
+        follow_job(submit_job("combine", excel_files))
+        st.stop()
     
     with st.spinner("Combinaison des fichiers Excel..."):
         try:
-            combined_data = {}
-            period = None
-            combined_global_names = []
-            combined_global_accounts = []
-            excel_struct = None  # Sera initialisé avec le premier fichier
-            
-            for idx, file in enumerate(excel_files):
-                wb_file = load_workbook(filename=io.BytesIO(file.read()), data_only=True)
-                ws_file = wb_file[config.EXCEL_SHEET_NAME]
-                client_name = ws_file["G3"].value
-                client_accounts = ws_file["G4"].value
-                file_period = ws_file["G5"].value
-                if idx == 0:
-                    period = file_period
-                    parts = period.split()
-                    if len(parts) < 9:
-                        raise ValueError("Format de période invalide dans le fichier Excel.")
-                    config.DATE_N_1 = parts[1]  # ex: "01/2023"
-                    config.DATE_N   = parts[8]  # ex: "12/2024"
-                    excel_struct = config.get_excel_structure(config.DATE_N_1, config.DATE_N)
-                    for table_key, years in excel_struct.items():
-                        combined_data[table_key] = {}
-                        for year, produits in years.items():
-                            combined_data[table_key][year] = {}
-                            for produit, cell in produits.items():
-                                combined_data[table_key][year][produit] = 0.0
-                if client_name:
-                    combined_global_names.append(str(client_name))
-                if client_accounts:
-                    combined_global_accounts.append(str(client_accounts))
-                for table_key, years in excel_struct.items():
-                    for year, produits in years.items():
-                        for produit, cell in produits.items():
-                            try:
-                                val = ws_file[cell].value
-                                if val is None:
-                                    val = 0.0
-                                else:
-                                    val = float(val)
-                            except (ValueError, TypeError):
-                                val = 0.0
-                            combined_data[table_key][year][produit] += val
-            
-            new_wb = load_template_workbook()
-            new_client_name = combined_global_names[0] if combined_global_names else ""
-            new_client_accounts = combined_global_accounts[0] if combined_global_accounts else ""
-            new_period = period if period else "Période inconnue"
-            new_ws = new_wb[config.EXCEL_SHEET_NAME]
-            new_ws["G3"].value = new_client_name
-            new_ws["G4"].value = new_client_accounts
-            new_ws["G5"].value = new_period
-            
-            new_ws["G3"].alignment = Alignment(wrap_text=True, horizontal="center", vertical="center")
-            new_ws.row_dimensions[3].height = 150
-            
-            parts = new_period.split()
-            if len(parts) < 9:
-                raise ValueError("Format de période invalide dans le fichier Excel.")
-            date_N_1 = parts[1]
-            date_N   = parts[8]
-            config.DATE_N_1 = date_N_1
-            config.DATE_N   = date_N
-            year_N_1 = date_N_1.split("/")[1]
-            year_N   = date_N.split("/")[1]
-            header_val_N_1 = int(year_N_1)
-            header_val_N   = int(year_N)
-            cells_N   = ["D9", "F9", "L9", "N9", "D36", "F36", "L36", "N36", "R9", "S37", "U37", "W37"]
-            cells_N_1 = ["E9", "G9", "M9", "O9", "E36", "G36", "M36", "O36", "T37", "V37", "X37"]
-            for cell in cells_N:
-                new_ws[cell].value = header_val_N
-            for cell in cells_N_1:
-                new_ws[cell].value = header_val_N_1
-            try:
-                header_I6 = int(date_N.split("/")[0])
-            except Exception:
-                header_I6 = 0
-            new_ws[config.GLOBAL_FIELDS["Dernier mois"]].value = header_I6
-            
-            new_wb = fill_excel_workbook_addition(new_wb, combined_data, new_period, new_client_name, new_client_accounts)
-            output_filename = f"ANALYSES DES FLUX {new_client_name}.xlsx"
-            output_buffer = io.BytesIO()
-            new_wb.save(output_buffer)
-            output_buffer.seek(0)
+            # Période, en-têtes et cumuls passés en paramètres : aucun état partagé entre les sessions
+            output_filename, content = combined_report(excel_files)
+            output_buffer = io.BytesIO(content)
             
             st.success("Les fichiers Excel ont été combinés avec succès !")
             st.download_button(
@@ -260,3 +385,5 @@ else:
             )
         except Exception as e:
             st.error(f"Une erreur s'est produite lors de la combinaison des fichiers Excel : {e}")
+    if profile_run:
+        show_profile("addition", excel_files)
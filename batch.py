@@ -0,0 +1,130 @@
+# batch.py
+import argparse
+import os
+import sys
+import time
+import config
+from pipeline import iter_extract_paths, client_key
+from records import RecordTable
+from multi_client import client_jobs, generate_reports
+from export import FORMATS, export_filename, write_export
+from store import get_default_store
+from instrumentation import configure_logging
+
+def iter_pdf_paths(input_dir, recursive=True):
+    # Parcours paresseux du répertoire : aucune liste complète des fichiers n'est construite
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+def run_batch(input_dir, period, output_dir, max_workers=None, use_cache=True, recursive=True, use_store=True, log=print,
+              progress=None, output_format="xlsx"):
+    # progress : appelé avec le nombre de fichiers traités après chaque fichier (suivi des tâches de jobs.py).
+    # output_format : "xlsx" (un classeur par client) ou un format d'export à plat de export.py (un seul fichier)
+    if output_format != "xlsx" and output_format not in FORMATS:
+        raise ValueError(f"Format de sortie inconnu : {output_format}")
+    parts = period.split()
+    if len(parts) < 9:
+        raise ValueError("Format de période invalide.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Seules les valeurs utiles de chaque fichier sont conservées, en colonnes ; cumul par client en une passe à la fin
+    records = RecordTable()
+    store = get_default_store() if use_store else None
+    to_store = []
+    clients = {}
+    nb_files = nb_errors = nb_skipped = nb_cached = 0
+    start = time.perf_counter()
+    for result in iter_extract_paths(iter_pdf_paths(input_dir, recursive), period, max_workers, use_cache):
+        nb_files += 1
+        if progress is not None:
+            progress(nb_files)
+        if result["error"]:
+            nb_errors += 1
+            log(f"ERREUR {result['name']} : {result['error']}")
+            continue
+        if result["cached"]:
+            nb_cached += 1
+        data = result["data"]
+        key = client_key(data)
+        clients[key] = clients.get(key, 0) + 1
+        if not records.append(data):
+            nb_skipped += 1
+            log(f"AVERTISSEMENT {result['name']} : produit ou année non reconnu")
+        elif store is not None:
+            to_store.append((result["digest"], data, result["name"]))
+            if len(to_store) >= 500:
+                store.add_many(to_store)
+                to_store = []
+        if nb_files % 100 == 0:
+            log(f"{nb_files} fichiers traités ({time.perf_counter() - start:.1f} s)")
+    if store is not None and to_store:
+        store.add_many(to_store)
+    extraction_time = time.perf_counter() - start
+
+    written = []
+    if output_format != "xlsx":
+        # Table à plat de tous les clients, écrite directement sur disque, sans générer de classeurs
+        path = os.path.join(output_dir, export_filename("ANALYSES DES FLUX", output_format))
+        with open(path, "wb") as f:
+            nb_rows = write_export(records, f, output_format)
+        written.append(path)
+        log(f"{path} ({nb_rows} lignes)")
+    else:
+        # Classeurs des clients générés en parallèle, écrits dans l'ordre des clients dès qu'ils sont prêts
+        file_counts = list(clients.values())
+        jobs = client_jobs(records.by_client(), period, clients)
+        for nb_client_files, (filename, content) in zip(file_counts, generate_reports(jobs, max_workers)):
+            path = os.path.join(output_dir, filename)
+            with open(path, "wb") as f:
+                f.write(content)
+            written.append(path)
+            log(f"{path} ({nb_client_files} fichiers)")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": nb_files,
+        "errors": nb_errors,
+        "skipped": nb_skipped,
+        "cached": nb_cached,
+        "clients": len(clients),
+        "workbooks": written,
+        "extraction_s": extraction_time,
+        "total_s": elapsed,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement par lot des PDF 'Analyse des ventes par client' : un classeur Excel par client.")
+    parser.add_argument("input_dir", help="Répertoire contenant les PDF")
+    parser.add_argument("--period", required=True, help='Période, ex. "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024"')
+    parser.add_argument("--output", default="sorties", help="Répertoire de sortie des classeurs (défaut : sorties)")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus d'extraction et de génération (défaut : nombre de cœurs)")
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache d'extraction")
+    parser.add_argument("--no-store", action="store_true", help="Ne pas enregistrer les chiffres dans la base (config.RECORD_STORE_PATH)")
+    parser.add_argument("--no-recursive", action="store_true", help="Ne pas parcourir les sous-répertoires")
+    parser.add_argument("--format", choices=("xlsx",) + FORMATS, default="xlsx",
+                        help="xlsx : un classeur par client (défaut) ; csv ou parquet : une table à plat de tous les clients")
+    parser.add_argument("--compression", type=int, choices=range(10), default=None,
+                        help="Niveau de compression des classeurs, 0 (rapide) à 9 (compact) (défaut : config.REPORT_COMPRESS_LEVEL)")
+    parser.add_argument("--log-level", default=None, help="Niveau de journalisation (défaut : config.LOG_LEVEL)")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+    if args.compression is not None:
+        config.REPORT_COMPRESS_LEVEL = args.compression
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Répertoire introuvable : {args.input_dir}")
+    report = run_batch(args.input_dir, args.period, args.output, args.workers,
+                       use_cache=not args.no_cache, recursive=not args.no_recursive,
+                       use_store=not args.no_store, output_format=args.format)
+    print(f"{report['files']} fichiers, {report['clients']} clients, {report['errors']} erreurs, "
+          f"{report['skipped']} ignorés, {report['cached']} depuis le cache")
+    print(f"Extraction : {report['extraction_s']:.1f} s — total : {report['total_s']:.1f} s")
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+# benchmark.py
+import argparse
+import glob
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import queue as queue_module
+import sys
+import time
+import warnings
+import config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Mesures de performance hors ligne sur des PDF synthétiques (synthetic_pdf.py). Chaque cas est exécuté dans
+# un processus neuf pour que le pic mémoire lui soit propre ; les résultats sont enregistrés en JSON dans
+# config.BENCHMARK_DIR et comparés au dernier enregistrement pour signaler les régressions.
+
+CASES = ("extraction", "upload", "parse_report", "fill_excel_workbook", "generate_report", "addition")
+DEFAULT_SIZES = (1, 12, 100, 1000)
+APP_MODES = ("Addition de fichiers Excel", "Rapport depuis la base")
+# Modules chargés au premier envoi de PDF (le script de l'application ne peut pas simuler l'envoi)
+UPLOAD_MODULES = ("extraction", "pipeline", "incremental")
+
+def peak_rss_mb():
+    # Pic de mémoire résidente du processus (None si indisponible, ex. Windows). Sous Linux, VmHWM : ru_maxrss
+    # survit à fork + exec et un processus "spawn" y retrouverait le pic de son parent.
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _single_report(expected, period):
+    from pipeline import add_to_aggregate
+    data_par_produit = {}
+    add_to_aggregate(data_par_produit, expected)
+    client_info = {
+        "Nom du client": expected["Nom du client"],
+        "Comptes clients": expected["Comptes clients"],
+        "Périodicité": period,
+    }
+    return data_par_produit, client_info
+
+def prepare_corpus(count, seed=0, directory=None):
+    # Jeu de PDF, textes et tableaux déjà lus (pour parse_report) et classeurs préremplis (pour l'addition).
+    # Réutilisé d'une exécution à l'autre tant que la version du générateur et la graine sont les mêmes.
+    from synthetic_pdf import GENERATOR_VERSION, write_corpus, corpus_period
+    directory = directory or os.path.join(config.BENCHMARK_DIR, f"corpus-v{GENERATOR_VERSION}-s{seed}")
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if len(manifest["files"]) >= count and manifest.get("backend") == config.EXTRACTION_BACKEND:
+            return directory, manifest
+
+    from extraction import BACKENDS, available_backends
+    from template_writer import generate_report
+    period = corpus_period()
+    backend = config.EXTRACTION_BACKEND if config.EXTRACTION_BACKEND in available_backends() else "pdfplumber"
+    files = write_corpus(os.path.join(directory, "pdf"), count, seed)
+    os.makedirs(os.path.join(directory, "xlsx"), exist_ok=True)
+    parsed = []
+    entries = []
+    for path, expected in files:
+        parsed.append(BACKENDS[backend](path))
+        report_path = os.path.join(directory, "xlsx", os.path.basename(path)[:-4] + ".xlsx")
+        with open(report_path, "wb") as f:
+            f.write(generate_report(*_single_report(expected, period)))
+        entries.append({"pdf": path, "xlsx": report_path, "expected": expected})
+    with open(os.path.join(directory, "parsed.pickle"), "wb") as f:
+        pickle.dump(parsed, f)
+    manifest = {"period": period, "backend": config.EXTRACTION_BACKEND, "files": entries}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return directory, manifest
+
+def _case_extraction(entries, directory, period):
+    from extraction import extract_data_from_pdf
+    def run(batch):
+        # Renvoie le nombre de fichiers dont les valeurs extraites diffèrent des valeurs générées
+        mismatches = 0
+        for entry in batch:
+            data, _ = extract_data_from_pdf(entry["pdf"], period=period)
+            if any(data.get(key) != value for key, value in entry["expected"].items()):
+                mismatches += 1
+        return mismatches
+    return run
+
+def _case_upload(entries, directory, period):
+    # Chemin de l'application : envois en mémoire analysés par IncrementalReport, dans le processus mesuré
+    # (un seul thread) pour que le pic mémoire couvre aussi les objets des moteurs PDF
+    from concurrent.futures import ThreadPoolExecutor
+    from incremental import IncrementalReport
+    config.EXTRACTION_CACHE_DIR = None
+    config.RECORD_STORE_PATH = None
+    def run(batch):
+        uploads = []
+        for entry in batch:
+            with open(entry["pdf"], "rb") as f:
+                upload = io.BytesIO(f.read())
+            upload.name = os.path.basename(entry["pdf"])
+            uploads.append(upload)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results, _ = IncrementalReport().update(uploads, period, executor)
+        return sum(1 for entry, result in zip(batch, results)
+                   if result["error"] or any(result["data"].get(key) != value for key, value in entry["expected"].items()))
+    return run
+
+def _case_parse_report(entries, directory, period):
+    # Coût de la reconnaissance seule (règles, en-têtes, totaux) sur des textes et tableaux déjà extraits
+    from extraction import parse_report
+    with open(os.path.join(directory, "parsed.pickle"), "rb") as f:
+        parsed = pickle.load(f)[:len(entries)]
+    def run(batch):
+        for text, analyse_table in parsed[:len(batch)]:
+            parse_report(text, analyse_table, period)
+    return run
+
+def _case_fill_excel_workbook(entries, directory, period):
+    from excel_generator import load_template_workbook, fill_excel_workbook
+    reports = [_single_report(entry["expected"], period) for entry in entries]
+    def run(batch):
+        for data_par_produit, client_info in reports[:len(batch)]:
+            wb = fill_excel_workbook(load_template_workbook(), data_par_produit, client_info)
+            wb.save(io.BytesIO())
+    return run
+
+def _case_generate_report(entries, directory, period):
+    from template_writer import generate_report
+    reports = [_single_report(entry["expected"], period) for entry in entries]
+    def run(batch):
+        for data_par_produit, client_info in reports[:len(batch)]:
+            generate_report(data_par_produit, client_info)
+    return run
+
+def _case_addition(entries, directory, period):
+    from excel_reader import combine_reports
+    def run(batch):
+        combine_reports([entry["xlsx"] for entry in batch])["records"].group_sum()
+    return run
+
+CASE_FUNCTIONS = {
+    "extraction": _case_extraction,
+    "upload": _case_upload,
+    "parse_report": _case_parse_report,
+    "fill_excel_workbook": _case_fill_excel_workbook,
+    "generate_report": _case_generate_report,
+    "addition": _case_addition,
+}
+
+def _run_case(case, size, directory, queue):
+    # Exécuté dans un processus neuf ; un premier passage sur un fichier (non mesuré) charge modules et template
+    warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+    # Chaque génération est mesurée, sans reprise depuis le cache des classeurs
+    config.REPORT_CACHE_ENTRIES = 0
+    config.REPORT_CACHE_DIR = None
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        entries = manifest["files"][:size]
+        input_key = "xlsx" if case == "addition" else "pdf"
+        input_mb = sum(os.path.getsize(entry[input_key]) for entry in entries) / (1024 * 1024)
+        run = CASE_FUNCTIONS[case](entries, directory, manifest["period"])
+        run(entries[:1])
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        mismatches = run(entries)
+        elapsed = time.perf_counter() - start
+        rss_after = peak_rss_mb()
+        queue.put({
+            "case": case,
+            "files": len(entries),
+            "seconds": round(elapsed, 4),
+            "files_per_s": round(len(entries) / elapsed, 2) if elapsed else None,
+            "peak_rss_mb": round(rss_after, 1) if rss_after is not None else None,
+            "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+            "input_mb": round(input_mb, 2),
+            "mismatches": mismatches or 0,
+            "error": None,
+        })
+    except Exception as e:
+        queue.put({"case": case, "files": size, "error": f"{type(e).__name__}: {e}"})
+
+def run_case(case, size, directory):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(case, size, directory, queue))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            if not process.is_alive():
+                # Processus tombé sans résultat (mémoire, segfault...)
+                result = {"case": case, "files": size, "error": f"processus arrêté (code {process.exitcode})"}
+                break
+    process.join()
+    return result
+
+def _run_startup(queue):
+    # Exécuté dans un processus neuf : premier affichage de la page (démarrage à froid), chargement des modules
+    # d'extraction, puis pour chaque autre mode premier affichage et réexécution
+    warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+    try:
+        start = time.perf_counter()
+        from streamlit.testing.v1 import AppTest
+        app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"), default_timeout=60)
+        app.run()
+        timings = {"cold_start": time.perf_counter() - start}
+        start = time.perf_counter()
+        for module in UPLOAD_MODULES:
+            __import__(module)
+        timings["modules d'extraction"] = time.perf_counter() - start
+        for mode in APP_MODES:
+            start = time.perf_counter()
+            app.radio[0].set_value(mode).run()
+            timings[f"{mode} : premier affichage"] = time.perf_counter() - start
+            start = time.perf_counter()
+            app.run()
+            timings[f"{mode} : réexécution"] = time.perf_counter() - start
+        queue.put({"timings_s": {name: round(elapsed, 4) for name, elapsed in timings.items()},
+                   "exceptions": [str(e.value) for e in app.exception], "error": None})
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def measure_startup():
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_startup, args=(queue,))
+    process.start()
+    result = queue.get(timeout=300)
+    process.join()
+    return result
+
+def startup_overruns(result):
+    # Mesures au-delà des budgets de config : démarrage à froid, premier affichage d'un mode, réexécution
+    overruns = []
+    for name, elapsed in result["timings_s"].items():
+        if name == "cold_start":
+            budget = config.STARTUP_BUDGET_S
+        elif name.endswith("réexécution"):
+            budget = config.RERUN_BUDGET_S
+        else:
+            budget = config.MODE_LOAD_BUDGET_S
+        if elapsed > budget:
+            overruns.append(f"{name} : {elapsed:.3f} s > {budget} s")
+    return overruns
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": config.EXTRACTION_BACKEND,
+        "compiled_template_writer": config.COMPILED_TEMPLATE_WRITER,
+    }
+
+def latest_result(directory=None):
+    paths = sorted(glob.glob(os.path.join(directory or config.BENCHMARK_DIR, "benchmark-*.json")))
+    return paths[-1] if paths else None
+
+def compare(results, baseline, threshold=None):
+    # Régression : débit en baisse ou pic mémoire en hausse au-delà du seuil, pour un même cas et une même taille
+    threshold = config.BENCHMARK_REGRESSION_THRESHOLD if threshold is None else threshold
+    reference = {(r["case"], r["files"]): r for r in baseline["results"] if not r.get("error")}
+    regressions = []
+    for result in results:
+        before = reference.get((result["case"], result["files"]))
+        if before is None or result.get("error"):
+            continue
+        result["baseline_files_per_s"] = before["files_per_s"]
+        if before["files_per_s"] and result["files_per_s"] < before["files_per_s"] * (1 - threshold):
+            regressions.append(f"{result['case']} x{result['files']} : débit {before['files_per_s']} -> {result['files_per_s']} fichiers/s")
+        if before.get("peak_rss_mb") and result.get("peak_rss_mb") and result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{result['case']} x{result['files']} : mémoire {before['peak_rss_mb']} -> {result['peak_rss_mb']} Mo")
+    return regressions
+
+def run_benchmarks(sizes=DEFAULT_SIZES, cases=CASES, seed=0, log=print):
+    directory, _ = prepare_corpus(max(sizes), seed)
+    results = []
+    for case in cases:
+        for size in sizes:
+            result = run_case(case, size, directory)
+            results.append(result)
+            if result["error"]:
+                log(f"{case:<20} {size:>5} fichiers : ERREUR {result['error']}")
+            else:
+                memory = f"{result['peak_rss_mb']:.0f} Mo" if result["peak_rss_mb"] is not None else "n/d"
+                log(f"{case:<20} {size:>5} fichiers : {result['seconds']:8.3f} s  {result['files_per_s']:9.1f} fichiers/s  "
+                    f"pic {memory}{'  ÉCARTS ' + str(result['mismatches']) if result['mismatches'] else ''}")
+    return results
+
+def memory_report(results):
+    # Pic mémoire par cas et par taille de lot, et pente entre le plus petit et le plus grand lot (Ko par fichier) :
+    # une pente proche de la taille moyenne des fichiers d'entrée, ou de zéro, indique une mémoire stable
+    lines = []
+    by_case = {}
+    for result in results:
+        if not result.get("error") and result.get("peak_rss_mb") is not None:
+            by_case.setdefault(result["case"], []).append(result)
+    for case, runs in by_case.items():
+        runs.sort(key=lambda result: result["files"])
+        peaks = "  ".join(f"x{result['files']}: {result['peak_rss_mb']:.0f} Mo" for result in runs)
+        first, last = runs[0], runs[-1]
+        if last["files"] > first["files"]:
+            slope = (last["peak_rss_mb"] - first["peak_rss_mb"]) * 1024 / (last["files"] - first["files"])
+            input_per_file = last["input_mb"] * 1024 / last["files"]
+            peaks += f"  — {slope:.1f} Ko/fichier (entrée {input_per_file:.1f} Ko/fichier)"
+        lines.append(f"{case:<20} {peaks}")
+    return lines
+
+def save_results(results, directory=None):
+    directory = directory or config.BENCHMARK_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("benchmark-%Y%m%d-%H%M%S.json"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "results": results},
+                  f, ensure_ascii=False, indent=2)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesures de performance sur des PDF synthétiques.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Nombres de fichiers (défaut : 1 12 100 1000)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES), help="Cas mesurés (défaut : tous)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur de PDF")
+    parser.add_argument("--baseline", default=None, help="Résultats de référence (défaut : dernier enregistrement)")
+    parser.add_argument("--threshold", type=float, default=None, help="Seuil de régression (défaut : config.BENCHMARK_REGRESSION_THRESHOLD)")
+    parser.add_argument("--no-save", action="store_true", help="Ne pas enregistrer les résultats")
+    parser.add_argument("--startup", action="store_true", help="Mesurer le démarrage de l'application au lieu des cas de traitement")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        result = measure_startup()
+        if result["error"]:
+            print(f"ERREUR {result['error']}")
+            return 1
+        for name, elapsed in result["timings_s"].items():
+            print(f"{name:<45} {elapsed:8.3f} s")
+        problems = startup_overruns(result) + [f"exception : {e}" for e in result["exceptions"]]
+        for problem in problems:
+            print(f"BUDGET DÉPASSÉ {problem}" if not problem.startswith("exception") else problem.upper())
+        return 1 if problems else 0
+
+    baseline_path = args.baseline or latest_result()
+    results = run_benchmarks(sorted(set(args.sizes)), args.cases, args.seed)
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        print(f"Référence : {baseline_path}")
+    if not args.no_save:
+        print(f"Résultats enregistrés : {save_results(results)}")
+    print("Pic mémoire :")
+    for line in memory_report(results):
+        print(f"  {line}")
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}")
+    failed = any(result["error"] or result.get("mismatches") for result in results)
+    return 1 if regressions or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# cache.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import config
+
+# À incrémenter lorsqu'une modification de extraction.py change les valeurs extraites
+CACHE_SCHEMA_VERSION = 4
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+def file_hash(path, chunk_size=1 << 20):
+    # Empreinte d'un fichier lu par blocs, sans le charger en mémoire
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def config_version():
+    payload = json.dumps(
+        {"mapping": config.PRODUCT_MAPPING, "tonnage": config.PRODUCT_TONNAGE_FIELD,
+         "backend": config.EXTRACTION_BACKEND, "rules": config.EXTRACTION_RULES, "schema": CACHE_SCHEMA_VERSION},
+        sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(digest, period):
+    key = f"{digest}|{period or ''}|{config_version()}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class ExtractionCache:
+    # Cache disque des résultats d'extraction, un fichier JSON par entrée, éviction LRU par taille totale
+    suffix = ".json"
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or config.EXTRACTION_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else config.EXTRACTION_CACHE_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        # Compteurs et taille totale partagés par les sessions de l'application
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _load(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _dump(self, data):
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = self._load(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # La date de modification sert d'horodatage LRU
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        payload = self._dump(data)
+        path = self._path(key)
+        try:
+            # Une entrée remplacée libère sa taille précédente
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # On redescend sous 90 % de la limite pour ne pas évincer à chaque écriture
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+        }
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_default_cache():
+    global _default_cache
+    if not config.EXTRACTION_CACHE_DIR:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache()
+        return _default_cache
+
+def report_key(*parts):
+    # Empreinte de tout ce qui détermine le contenu d'un classeur (valeurs écrites, template, compression)
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class _BytesCache(ExtractionCache):
+    # Niveau disque du cache des classeurs : contenu déjà sérialisé, tel quel
+    suffix = ".bin"
+
+    def _load(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _dump(self, data):
+        return data
+
+class ReportCache:
+    # Classeurs générés (octets .xlsx) : LRU en mémoire borné en nombre d'entrées, second niveau optionnel sur
+    # disque partagé entre processus et redémarrages. Un clic sur un bouton ou une nouvelle session qui redemande
+    # le même rapport reçoit les octets déjà produits.
+    def __init__(self, max_entries=None, directory=None, max_bytes=None):
+        self.max_entries = config.REPORT_CACHE_ENTRIES if max_entries is None else max_entries
+        self.memory = OrderedDict()
+        directory = directory if directory is not None else config.REPORT_CACHE_DIR
+        self.disk = _BytesCache(directory, max_bytes if max_bytes is not None else config.REPORT_CACHE_MAX_BYTES) \
+            if directory else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            content = self.memory.get(key)
+            if content is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return content
+        content = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, content)
+        return content
+
+    def put(self, key, content):
+        self._remember(key, content)
+        if self.disk is not None:
+            self.disk.put(key, content)
+
+    def _remember(self, key, content):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self.memory[key] = content
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        # Renvoie le contenu mémorisé, sinon le produit avec create() et le mémorise
+        content = self.get(key)
+        if content is None:
+            content = create()
+            self.put(key, content)
+        return content
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "entries": len(self.memory),
+                     "size_bytes": sum(len(content) for content in self.memory.values())}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+_report_cache = None
+
+def get_report_cache():
+    global _report_cache
+    if config.REPORT_CACHE_ENTRIES <= 0 and not config.REPORT_CACHE_DIR:
+        return None
+    with _default_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache()
+        return _report_cache
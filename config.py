@@ -1,4 +1,10 @@
 # config.py
+import os
+from functools import lru_cache
+
+# Répertoire de l'application : cache, base et file de tâches y sont rangés quel que soit le répertoire courant,
+# pour que l'application, batch.py et jobs.py lancés d'ailleurs partagent les mêmes fichiers
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Mapping des produits (en minuscules lors de l'extraction)
 PRODUCT_MAPPING = {
@@ -22,6 +28,33 @@ PRODUCT_TONNAGE_FIELD = {
     "Direct Inter": "Tonnage",
 }
 
+# Règles d'extraction des PDF "Analyse des ventes par client", compilées une seule fois par rules.py.
+# Les listes de motifs sont essayées dans l'ordre ; le premier qui correspond est retenu.
+EXTRACTION_RULES = {
+    # Nom du client : texte entre le titre du rapport et la date d'édition
+    "client_name": [
+        r'Analyse des ventes par client\s+([^\s].*?)\s+\d{2}/\d{2}/\d{4}',
+        r'Analyse des ventes par client\s+(.+?)\s+\d{2}/\d{2}/\d{4}',
+    ],
+    # Liste des comptes entre crochets, puis motif d'un numéro de compte
+    "accounts": [r'Compte(?:\(s\))?\s*:\s*\[([^\]]+)\]'],
+    "account_number": r'\d+',
+    # Produit : premier crochet après les comptes (ou dans tout le texte), clé = premiers mots en minuscules
+    "product": [r'\[([^\]]+)\]'],
+    "product_key_words": 2,
+    # Tableau "Analyse par mois de transport" : repéré par ce mot dans une cellule d'en-tête
+    "month_table_header": "mois",
+    "year": r'(\d{4})',
+    # Alias d'en-têtes (recherche de sous-chaîne, en minuscules) ; le tonnage suit PRODUCT_TONNAGE_FIELD
+    "header_aliases": {
+        "RC": ["nb rc", "nb dossier"],
+        "CA": ["ca ht facturé", "ca ht facture"],
+    },
+    "default_tonnage_field": "Tonnage",
+    # Libellés de la ligne de totaux
+    "total_markers": ["totaux", "total"],
+}
+
 # Fonction retournant la structure Excel selon deux dates (au format mm/aaaa)
 def get_excel_structure(date1, date2):
     year_N_1 = int(date1.split("/")[1])
@@ -91,5 +124,129 @@ GLOBAL_FIELDS = {
     "Dernier mois": "I6"  # Le dernier mois sera écrit ici sous format numérique
 }
 
+# Cellules d'en-tête recevant l'année N et l'année N-1
+HEADER_CELLS_N   = ["D9", "F9", "L9", "N9", "D36", "F36", "L36", "N36", "R9", "S37", "U37", "W37"]
+HEADER_CELLS_N_1 = ["E9", "G9", "M9", "O9", "E36", "G36", "M36", "O36", "T37", "V37", "X37"]
+
+# Cellules des tableaux et valeurs d'en-tête d'une période, calculées une seule fois par couple de dates
+# (résultats partagés : à ne pas modifier)
+@lru_cache(maxsize=64)
+def structure_cells(date1, date2):
+    # (tableau, année, produit, cellule) dans l'ordre de get_excel_structure
+    return tuple((tableau, annee, produit, cell)
+                 for tableau, annees in get_excel_structure(date1, date2).items()
+                 for annee, produits in annees.items()
+                 for produit, cell in produits.items())
+
+@lru_cache(maxsize=64)
+def header_values(date1, date2):
+    # (cellule, valeur) : dernier mois de la période, puis année N et année N-1 dans les cellules d'en-tête
+    try:
+        last_month = int(date2.split("/")[0])
+    except Exception:
+        last_month = 0
+    year_N_1 = int(date1.split("/")[1])
+    year_N   = int(date2.split("/")[1])
+    return (((GLOBAL_FIELDS["Dernier mois"], last_month),)
+            + tuple((cell, year_N) for cell in HEADER_CELLS_N)
+            + tuple((cell, year_N_1) for cell in HEADER_CELLS_N_1))
+
 # Nom de la feuille Excel contenant toutes les tables
 EXCEL_SHEET_NAME = "KPI activité client"
+
+# Nombre de processus utilisés pour l'extraction parallèle des PDF (None = nombre de cœurs)
+EXTRACTION_WORKERS = None
+
+# Démarrage des processus des pools : "forkserver" (repli sur "spawn" s'il n'existe pas) ou "spawn" ;
+# jamais "fork" depuis le serveur Streamlit multithreadé
+POOL_START_METHOD = "forkserver"
+
+# Nouvelles soumissions d'une analyse du pool partagé interrompue par la mort d'un de ses processus (pool
+# reconstruit) : les fichiers des autres sessions en cours au même moment ne sont pas perdus
+POOL_TASK_RETRIES = 1
+
+# Cache disque des résultats d'extraction (None pour le désactiver) et taille maximale en octets
+EXTRACTION_CACHE_DIR = os.path.join(APP_DIR, ".cache", "extraction")
+EXTRACTION_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Moteur d'extraction PDF : "pymupdf" (rapide, repli automatique sur pdfplumber) ou "pdfplumber"
+EXTRACTION_BACKEND = "pymupdf"
+
+# Génération des rapports par modification directe du XML du template (False = openpyxl)
+COMPILED_TEMPLATE_WRITER = True
+
+# Niveau de compression ZIP des classeurs générés : None = défaut de zlib, 0 = sans compression (le plus rapide,
+# fichiers plus gros), 1 à 9 = du plus rapide au plus compact. Sans effet sur l'écriture openpyxl.
+REPORT_COMPRESS_LEVEL = None
+
+# Cache des classeurs générés : nombre de classeurs gardés en mémoire (0 pour le désactiver), répertoire
+# du second niveau sur disque (None : mémoire seule) et sa taille maximale en octets
+REPORT_CACHE_ENTRIES = 32
+REPORT_CACHE_DIR = None
+REPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Journalisation : enregistrements JSON des temps par étape et par fichier, niveau du logger,
+# et copie du texte complet des PDF dans les journaux (niveau DEBUG uniquement)
+METRICS_LOG = True
+LOG_LEVEL = "INFO"
+LOG_PDF_TEXT = False
+
+# Profilage à la demande (profiling.py) : case à cocher dans la barre latérale de l'application (le traitement
+# est alors rejoué sous cProfile) et nombre de fonctions retenues par étape dans le résumé
+PROFILING_UI = False
+PROFILE_TOP_FUNCTIONS = 15
+
+# Mesures de performance (benchmark.py) : répertoire des jeux synthétiques et des résultats,
+# et baisse de débit ou hausse de mémoire tolérée avant de signaler une régression
+BENCHMARK_DIR = os.path.join(APP_DIR, ".cache", "benchmarks")
+BENCHMARK_REGRESSION_THRESHOLD = 0.15
+
+# Zones d'intérêt de la première page (en-tête du rapport et tableau des mois) : l'analyse se limite à ces
+# zones, avec repli sur la page entière si l'en-tête ou le tableau n'y est pas trouvé. Les zones sont apprises
+# par format de page sur le premier fichier lu en entier, ou fixées ici sous la forme
+# {"595x842": {"header": (x0, haut, x1, bas), "table": (x0, haut, x1, bas)}} en points, origine en haut à gauche.
+EXTRACTION_ROI = True
+EXTRACTION_REGIONS = {}
+EXTRACTION_ROI_MARGIN = 10
+
+# Nombre maximal de PDF par analyse dans l'application : entier fixe, ou None pour le déduire du débit
+# d'extraction mesuré afin que le traitement tienne dans UPLOAD_TIME_BUDGET_S secondes
+# (ESTIMATED_FILE_SECONDS par fichier tant qu'aucune mesure n'est disponible)
+MAX_UPLOAD_FILES = None
+UPLOAD_TIME_BUDGET_S = 120
+ESTIMATED_FILE_SECONDS = 0.5
+
+# Fichiers PDF au-delà de cette taille : écrits dans un fichier temporaire (répertoire UPLOAD_SPILL_DIR, None pour
+# celui du système) et lus depuis le disque par le moteur PDF, au lieu d'être copiés vers le processus d'analyse
+UPLOAD_SPILL_BYTES = 8 * 1024 * 1024
+UPLOAD_SPILL_DIR = None
+
+# Budget de démarrage de l'application (benchmark.py --startup) : premier affichage de la page dans un
+# processus neuf, premier affichage d'un mode (chargement de ses modules) et réexécution du script, en secondes
+STARTUP_BUDGET_S = 1.5
+MODE_LOAD_BUDGET_S = 1.0
+RERUN_BUDGET_S = 0.2
+
+# Mode multi-clients : nombre minimal de clients pour générer les classeurs dans des processus séparés
+# (en dessous, le démarrage des processus coûte plus que la génération elle-même)
+MULTI_CLIENT_PARALLEL_MIN = 8
+
+# Base SQLite des chiffres extraits (store.py), alimentée par l'application et le traitement par lot :
+# permet de produire un rapport pour une autre période sans réanalyser les PDF (None pour désactiver)
+RECORD_STORE_PATH = os.path.join(APP_DIR, ".cache", "records.sqlite3")
+
+# Service de tâches (jobs.py) : avec JOB_QUEUE_ENABLED, l'application dépose les traitements dans la file au lieu
+# de les exécuter dans le script et n'en suit que l'état ; le service (python jobs.py serve) doit être démarré.
+# JOB_WORKERS processus de traitement (None : nombre de cœurs), chacun analysant ses PDF avec JOB_EXTRACTION_WORKERS
+# processus ; une tâche sans signe de vie depuis JOB_STALE_S secondes est reprise (au plus JOB_MAX_ATTEMPTS fois),
+# les tâches terminées et leurs classeurs sont conservés JOB_RETENTION_S secondes.
+JOB_QUEUE_ENABLED = False
+JOB_QUEUE_PATH = os.path.join(APP_DIR, ".cache", "jobs", "jobs.sqlite3")
+JOB_DIR = os.path.join(APP_DIR, ".cache", "jobs")
+JOB_WORKERS = None
+JOB_EXTRACTION_WORKERS = 1
+JOB_POLL_INTERVAL_S = 0.5
+JOB_HEARTBEAT_S = 10
+JOB_STALE_S = 120
+JOB_MAX_ATTEMPTS = 3
+JOB_RETENTION_S = 7 * 24 * 3600
@@ -0,0 +1,188 @@
+# excel_reader.py
+import io
+import os
+import zipfile
+from xml.etree.ElementTree import iterparse
+import numpy as np
+from openpyxl.utils.cell import coordinate_from_string
+import config
+from instrumentation import stage
+from template_writer import find_sheet_path
+from records import RecordTable
+
+# Lecture rapide des classeurs préremplis pour le mode "Addition de fichiers Excel" : seul le XML de la feuille
+# est parcouru en flux, jusqu'à la dernière ligne utile, sans charger le classeur avec openpyxl.
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+HEADER_FIELDS = ("Nom du client", "Comptes clients", "Périodicité")
+
+def structure_cells(period):
+    # Ordre fixe (tableau, année, produit, cellule) des cellules additionnées, dérivé de get_excel_structure
+    parts = period.split()
+    if len(parts) < 9:
+        raise ValueError("Format de période invalide dans le fichier Excel.")
+    return list(config.structure_cells(parts[1], parts[8]))
+
+def _cast_number(value):
+    # Même conversion qu'openpyxl : entier sauf présence d'un point ou d'un exposant
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+def _si_text(si):
+    # Texte d'une chaîne partagée, hors annotations phonétiques
+    if si.find(f"{NS}t") is not None:
+        return si.find(f"{NS}t").text or ""
+    return "".join(r.findtext(f"{NS}t") or "" for r in si.findall(f"{NS}r"))
+
+def _shared_strings(archive, wanted):
+    # Ne décode que jusqu'au plus grand indice réellement référencé
+    if not wanted:
+        return {}
+    try:
+        part = archive.open("xl/sharedStrings.xml")
+    except KeyError:
+        return {}
+    strings = {}
+    last = max(wanted)
+    idx = 0
+    with part:
+        for _, elem in iterparse(part):
+            if elem.tag == f"{NS}si":
+                if idx in wanted:
+                    strings[idx] = _si_text(elem)
+                idx += 1
+                elem.clear()
+                if idx > last:
+                    break
+    return strings
+
+def read_cells(source, cells, sheet_name=None):
+    # Renvoie {cellule: valeur} avec les valeurs en cache (équivalent de load_workbook(data_only=True))
+    sheet_name = sheet_name or config.EXCEL_SHEET_NAME
+    wanted = set(cells)
+    last_row = max(coordinate_from_string(cell)[1] for cell in wanted)
+    raw = {}
+    with zipfile.ZipFile(source) as archive:
+        sheet_path = find_sheet_path(archive.read, sheet_name)
+        with archive.open(sheet_path) as sheet:
+            for _, elem in iterparse(sheet):
+                if elem.tag == f"{NS}c":
+                    ref = elem.get("r")
+                    if ref in wanted:
+                        cell_type = elem.get("t", "n")
+                        if cell_type == "inlineStr":
+                            raw[ref] = (cell_type, "".join(t.text or "" for t in elem.iter(f"{NS}t")))
+                        else:
+                            v = elem.find(f"{NS}v")
+                            raw[ref] = (cell_type, v.text if v is not None else None)
+                elif elem.tag == f"{NS}row":
+                    elem.clear()
+                    if int(elem.get("r", 0)) >= last_row:
+                        break
+        shared = _shared_strings(archive, {int(v) for t, v in raw.values() if t == "s" and v is not None})
+
+    values = {}
+    for ref in cells:
+        cell_type, value = raw.get(ref, ("n", None))
+        if value is None:
+            values[ref] = None
+        elif cell_type == "s":
+            values[ref] = shared.get(int(value))
+        elif cell_type == "n":
+            values[ref] = _cast_number(value)
+        elif cell_type == "b":
+            values[ref] = value == "1"
+        else:
+            values[ref] = value
+    return values
+
+def _to_float(value):
+    try:
+        return 0.0 if value is None else float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def upload_source(file):
+    # (nom, source lisible par zipfile) sans copier le contenu : chemin tel quel, ou fichier envoyé remis au début.
+    # Seuls le répertoire de l'archive, la feuille et les chaînes partagées sont lus.
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.basename(file), file
+    file.seek(0)
+    return getattr(file, "name", "classeur.xlsx"), file
+
+def _read_report(name, source, header_cells, value_cells):
+    values = read_cells(source, header_cells + value_cells)
+    header = [values[cell] for cell in header_cells]
+    totals = np.fromiter((_to_float(values[cell]) for cell in value_cells), dtype=np.float64, count=len(value_cells))
+    return name, header, totals
+
+def combine_reports(files):
+    # Additionne les classeurs préremplis ; la période et la structure sont celles du premier fichier.
+    # Lecture dans le thread courant : l'analyse XML tient le GIL, des threads n'apportent rien, et quelques
+    # millisecondes par classeur ne justifient pas l'envoi de son contenu à un processus fils.
+    uploads = [upload_source(file) for file in files]
+    if not uploads:
+        raise ValueError("Aucun fichier Excel fourni.")
+    header_cells = [config.GLOBAL_FIELDS[field] for field in HEADER_FIELDS]
+    # Les coordonnées des cellules ne dépendent pas des années : une période quelconque suffit pour les lister
+    value_cells = [cell for *_, cell in structure_cells("Du 01/2000 au 12/2000 et du 01/2001 au 12/2001")]
+
+    with stage("read"):
+        reports = [_read_report(*upload, header_cells, value_cells) for upload in uploads]
+
+    period = reports[0][1][2]
+    if not isinstance(period, str):
+        raise ValueError("Format de période invalide dans le fichier Excel.")
+    cells = structure_cells(period)
+    names = []
+    accounts = []
+    # Un enregistrement par classeur, produit et année, additionnés ensuite par records.RecordTable
+    records = RecordTable()
+    with stage("aggregation"):
+        _append_records(records, reports, cells, names, accounts)
+    return {
+        "period": period,
+        "client_names": names,
+        "client_accounts": accounts,
+        "records": records,
+        "files": len(reports),
+    }
+
+def _append_records(records, reports, cells, names, accounts):
+    for _, (client_name, client_accounts, _), values in reports:
+        if client_name:
+            names.append(str(client_name))
+        if client_accounts:
+            accounts.append(str(client_accounts))
+        rows = {}
+        for (table_key, year, produit, _), value in zip(cells, values.tolist()):
+            rows.setdefault((produit, year), {})[table_key] = value
+        for (produit, year), fields in rows.items():
+            records.append({
+                "Nom du client": str(client_name or ""),
+                "Comptes clients": str(client_accounts).split(", ") if client_accounts else [],
+                "Produit concerné": produit,
+                "Année": year,
+                **fields,
+            })
+
+def combined_report(files):
+    # Classeur d'addition complet, comme le mode Addition de l'application : renvoie (nom de fichier, contenu .xlsx)
+    from openpyxl.styles import Alignment
+    from excel_generator import load_template_workbook, fill_excel_workbook_addition
+    combined = combine_reports(files)
+    client_name = combined["client_names"][0] if combined["client_names"] else ""
+    client_accounts = combined["client_accounts"][0] if combined["client_accounts"] else ""
+    period = combined["period"] if combined["period"] else "Période inconnue"
+    with stage("template_load"):
+        wb = load_template_workbook()
+    with stage("fill"):
+        ws = wb[config.EXCEL_SHEET_NAME]
+        ws["G3"].alignment = Alignment(wrap_text=True, horizontal="center", vertical="center")
+        ws.row_dimensions[3].height = 150
+        wb = fill_excel_workbook_addition(wb, combined["records"], period, client_name, client_accounts)
+    with stage("save"):
+        buffer = io.BytesIO()
+        wb.save(buffer)
+    return f"ANALYSES DES FLUX {client_name}.xlsx", buffer.getvalue()
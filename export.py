@@ -0,0 +1,104 @@
+# export.py
+import csv
+import io
+import os
+import sys
+from records import KEY_COLUMNS
+
+# Export à plat des chiffres agrégés pour les traitements BI : une ligne par client, comptes, produit et année
+# avec RC, Tonnage et CA, soit les cumuls que fill_excel_workbook écrit dans le template, sans template ni
+# openpyxl. CSV (module csv) ou Parquet (pyarrow, importé seulement pour ce format) ; les lignes sont écrites
+# par paquets dans le fichier de sortie (disque ou mémoire pour le bouton de téléchargement).
+
+COLUMNS = ("client", "accounts", "product", "year", "rc", "tonnage", "ca")
+FORMATS = ("csv", "parquet")
+MIME_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+PARQUET_ROW_GROUP = 65536
+# Tonnage et CA arrondis à la précision des PDF (2 décimales) : retire le bruit des sommes de flottants
+# (3263263.6799999997). Le classeur, lui, tronque ces valeurs à l'entier (coerce_cell_value).
+DECIMALS = 2
+
+def tidy_rows(records):
+    # records : RecordTable ; lignes (client, comptes, produit, année, RC, Tonnage, CA) triées par clé
+    for (client, accounts, produit, annee), values in sorted(records.group_sum(KEY_COLUMNS).items()):
+        yield (client, accounts, produit, annee, int(values["RC"]), round(values["Tonnage"], DECIMALS),
+               round(values["CA"], DECIMALS))
+
+def write_csv(rows, fileobj, delimiter=","):
+    # fileobj : fichier binaire ; renvoie le nombre de lignes écrites (hors en-tête)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(text, delimiter=delimiter)
+        writer.writerow(COLUMNS)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        text.flush()
+    finally:
+        # Le fichier reste ouvert pour l'appelant
+        text.detach()
+    return count
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow est requis pour l'export Parquet.")
+    return pyarrow, pyarrow.parquet
+
+def write_parquet(rows, fileobj, row_group=PARQUET_ROW_GROUP):
+    # Un groupe de lignes Parquet par paquet de row_group lignes ; renvoie le nombre de lignes écrites
+    pa, pq = _parquet()
+    schema = pa.schema([(name, pa.string()) for name in COLUMNS[:4]] +
+                       [("rc", pa.int64()), ("tonnage", pa.float64()), ("ca", pa.float64())])
+    count = 0
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= row_group:
+                writer.write_table(_parquet_table(pa, schema, chunk))
+                count += len(chunk)
+                chunk = []
+        if chunk or not count:
+            writer.write_table(_parquet_table(pa, schema, chunk))
+            count += len(chunk)
+    return count
+
+def _parquet_table(pa, schema, chunk):
+    columns = list(zip(*chunk)) if chunk else [[] for _ in COLUMNS]
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+def write_export(records, fileobj, output_format="csv"):
+    # Écrit la table à plat des cumuls de records au format demandé ; renvoie le nombre de lignes
+    if output_format == "csv":
+        return write_csv(tidy_rows(records), fileobj)
+    if output_format == "parquet":
+        return write_parquet(tidy_rows(records), fileobj)
+    raise ValueError(f"Format d'export inconnu : {output_format}")
+
+def export_bytes(records, output_format="csv"):
+    buffer = io.BytesIO()
+    write_export(records, buffer, output_format)
+    return buffer.getvalue()
+
+def export_filename(base, output_format):
+    return f"{base}.{output_format}"
+
+if __name__ == "__main__":
+    # Usage : python export.py <fichier.csv|fichier.parquet> [client] — chiffres de la base (config.RECORD_STORE_PATH)
+    from store import get_default_store
+    if len(sys.argv) < 2 or os.path.splitext(sys.argv[1])[1].lstrip(".") not in FORMATS:
+        print("Usage : python export.py <fichier.csv|fichier.parquet> [client]")
+        sys.exit(1)
+    store = get_default_store(create=False)
+    if store is None:
+        print("Aucune base : désactivée (config.RECORD_STORE_PATH) ou pas encore créée.")
+        sys.exit(1)
+    path = sys.argv[1]
+    with open(path, "wb") as f:
+        count = write_export(store.records(client=sys.argv[2] if len(sys.argv) > 2 else None), f,
+                             os.path.splitext(path)[1].lstrip("."))
+    print(f"{path} : {count} lignes")
@@ -1,141 +1,362 @@
 # extraction.py
-import pdfplumber
-import re
-import string
-from config import PRODUCT_MAPPING, PRODUCT_TONNAGE_FIELD
+import config
+from rules import RULES
+from instrumentation import logger, stage, current_trace
 
-def extract_data_from_pdf(pdf, period=None):
-    data = {}
-    with pdfplumber.open(pdf) as pdf_obj:
-        first_page = pdf_obj.pages[0]
-        text = first_page.extract_text()
-        full_text = text
-
-        print("----- Début du texte du PDF -----")
-        print(text)
-        print("----- Fin du texte du PDF -----")
-
-        # Extraction du Nom du client
-        client_match = re.search(
-            r'Analyse des ventes par client\s+([^\s].*?)\s+\d{2}/\d{2}/\d{4}',
-            text, re.IGNORECASE)
-        if client_match:
-            data['Nom du client'] = client_match.group(1).strip()
-        else:
-            client_match = re.search(
-                r'Analyse des ventes par client\s+(.+?)\s+\d{2}/\d{2}/\d{4}',
-                text, re.IGNORECASE)
-            data['Nom du client'] = client_match.group(1).strip() if client_match else ''
-
-        # Extraction des Comptes clients
-        comptes_match = re.search(
-            r'Compte(?:\(s\))?\s*:\s*\[([^\]]+)\]', text, re.IGNORECASE)
-        if comptes_match:
-            comptes_str = comptes_match.group(1)
-            comptes = re.findall(r'\d+', comptes_str)
-            data['Comptes clients'] = comptes
-            print(f"Comptes clients trouvés : {comptes}")
-        else:
-            data['Comptes clients'] = []
-            print("Comptes clients non trouvés")
-
-        # Extraction du Produit concerné
-        if comptes_match:
-            start_pos = comptes_match.end()
-            text_after = text[start_pos:]
-            produit_match = re.search(r'\[([^\]]+)\]', text_after, re.IGNORECASE)
-            if produit_match:
-                produit_full = produit_match.group(1).strip()
-                produit = ' '.join(produit_full.split()[:2]).strip().lower().strip(string.punctuation)
-                print(f"Produit extrait : {produit}")
-                data['Produit concerné'] = PRODUCT_MAPPING.get(produit, None)
-            else:
-                data['Produit concerné'] = None
-                print("Produit non trouvé après comptes")
-        else:
-            produit_match = re.search(r'\[([^\]]+)\]', text, re.IGNORECASE)
-            if produit_match:
-                produit_full = produit_match.group(1).strip()
-                produit = ' '.join(produit_full.split()[:2]).strip().lower().strip(string.punctuation)
-                print(f"Produit extrait (alternative) : {produit}")
-                data['Produit concerné'] = PRODUCT_MAPPING.get(produit, None)
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+def is_month_table(table):
+    return RULES.is_month_table(table)
+
+class PdfplumberPages:
+    # Accès aux pages pdfplumber ; clip = (x0, haut, x1, bas) en points, origine en haut à gauche
+    @staticmethod
+    def size(page):
+        return page.width, page.height
+
+    @staticmethod
+    def _crop(page, clip):
+        if clip is None:
+            return page
+        x0, top, x1, bottom = page.bbox
+        return page.crop((max(clip[0], x0), max(clip[1], top), min(clip[2], x1), min(clip[3], bottom)))
+
+    @staticmethod
+    def text(page, clip=None):
+        return PdfplumberPages._crop(page, clip).extract_text() or ''
+
+    @staticmethod
+    def month_table(page, clip=None):
+        # Renvoie (lignes, bbox) du tableau des mois ou None
+        page = PdfplumberPages._crop(page, clip)
+        for table in page.find_tables():
+            header_row = table.rows[0]
+            header_bbox = (table.bbox[0], header_row.bbox[1], table.bbox[2], header_row.bbox[3])
+            header_text = page.crop(header_bbox).extract_text() or ''
+            if RULES.month_table_header not in header_text.lower():
+                continue
+            extracted = table.extract()
+            if is_month_table(extracted):
+                return extracted, table.bbox
+        return None
+
+    @staticmethod
+    def tables(page):
+        return [table.extract() for table in sorted(page.find_tables(), key=lambda table: table.bbox[1])]
+
+    @staticmethod
+    def release(page):
+        # Libère les caractères et objets de mise en page de la page
+        page.close()
+
+def has_total_row(table):
+    return any(row and RULES.is_total(row[0]) for row in table)
+
+def _header_found(text):
+    return bool(RULES.find_client_name(text)) and RULES.find_product(text)[0] is not None
+
+def _continuation(tables, width):
+    # Suite du tableau des mois en haut de la page suivante : premier tableau de même largeur,
+    # sans la ligne d'en-tête si elle est répétée
+    for rows in tables:
+        if rows and len(rows[0]) == width:
+            return rows[1:] if is_month_table(rows) else rows
+    return None
+
+# Zones d'intérêt apprises sur les fichiers lus en pleine page, par format de page
+_learned_regions = {}
+
+def layout_key(width, height):
+    return f"{round(width)}x{round(height)}"
+
+def regions_for(width, height):
+    if not config.EXTRACTION_ROI:
+        return None
+    key = layout_key(width, height)
+    return config.EXTRACTION_REGIONS.get(key) or _learned_regions.get(key)
+
+def learn_regions(width, height, table_bbox, margin=None):
+    # En-tête : toute la largeur au-dessus du tableau ; tableau : ses colonnes élargies de la marge, jusqu'au bas de page
+    margin = config.EXTRACTION_ROI_MARGIN if margin is None else margin
+    x0, top, x1, _ = table_bbox
+    regions = {
+        "header": (0, 0, width, top),
+        "table": (max(0, x0 - margin), max(0, top - margin), min(width, x1 + margin), height),
+    }
+    _learned_regions[layout_key(width, height)] = regions
+    return regions
+
+def _table_complete(text, table):
+    # Tableau lu dans la zone d'intérêt utilisable tel quel : colonnes RC, Tonnage et CA et ligne de totaux.
+    # Un tableau déplacé peut être coupé par la zone apprise sur un autre rapport du même format.
+    if not has_total_row(table):
+        return False
+    _, comptes_end = RULES.find_accounts(text)
+    _, produit = RULES.find_product(text, comptes_end or 0)
+    header_map = RULES.map_headers(table[0], produit)
+    return all(field in header_map for field in ('RC', 'Tonnage', 'CA'))
+
+def _read_first_page(page, reader):
+    # Essaie d'abord les zones d'intérêt du format de page ; en cas d'échec, pleine page et apprentissage des zones
+    width, height = reader.size(page)
+    regions = regions_for(width, height)
+    if regions:
+        with stage("text_extraction"):
+            text = reader.text(page, regions["header"])
+        found = None
+        if _header_found(text):
+            with stage("table_extraction"):
+                found = reader.month_table(page, regions["table"])
+        if found and _table_complete(text, found[0]):
+            _note_roi("hit")
+            return text, found[0]
+        _note_roi("miss")
+        logger.debug(f"Zones d'intérêt {layout_key(width, height)} sans en-tête ou tableau complet : lecture pleine page")
+    with stage("text_extraction"):
+        text = reader.text(page)
+    with stage("table_extraction"):
+        found = reader.month_table(page)
+    if found and config.EXTRACTION_ROI and layout_key(width, height) not in config.EXTRACTION_REGIONS:
+        learn_regions(width, height, found[1])
+    return text, found[0] if found else None
+
+def _note_roi(outcome):
+    current = current_trace()
+    if current is not None:
+        current.fields["roi"] = outcome
+
+def stream_report(pages, reader):
+    # Parcourt les pages une à une jusqu'à disposer de l'en-tête du rapport et de la ligne de totaux.
+    # Un tableau des mois sans totaux est complété par le tableau qui ouvre la page suivante.
+    texts = []
+    analyse_table = None
+    header_found = False
+    for number, page in enumerate(pages):
+        try:
+            if number == 0:
+                text, analyse_table = _read_first_page(page, reader)
+                texts.append(text)
+                header_found = _header_found(text)
             else:
-                data['Produit concerné'] = None
-                print("Produit non trouvé dans le texte")
-        
-        # Extraction des données du tableau (année, RC, Tonnage, CA)
-        tables = pdf_obj.pages[0].extract_tables()
-        analyse_table = None
-        for table in tables:
-            headers = table[0]
-            if any(header and 'mois' in header.lower() for header in headers):
-                analyse_table = table
-                break
-
-        if analyse_table:
-            print("Table 'Analyse par mois de transport' trouvée")
-            tonnage_field = PRODUCT_TONNAGE_FIELD.get(data.get('Produit concerné'), 'Tonnage')
-            header_map = {}
-            for idx, header in enumerate(analyse_table[0]):
-                if header:
-                    header_clean = header.strip().lower()
-                    if 'nb rc' in header_clean or 'nb dossier' in header_clean:
-                        header_map['RC'] = idx
-                    if header_clean == tonnage_field.lower():
-                        header_map['Tonnage'] = idx
-                    if 'ca ht facturé' in header_clean or 'ca ht facture' in header_clean:
-                        header_map['CA'] = idx
-            print(f"Mapping des en-têtes : {header_map}")
-
-            if not all(k in header_map for k in ['RC', 'Tonnage', 'CA']):
-                data['RC'] = data['Tonnage'] = data['CA'] = 0
+                if not header_found:
+                    with stage("text_extraction"):
+                        texts.append(reader.text(page))
+                    header_found = _header_found("\n".join(texts))
+                if analyse_table is None:
+                    with stage("table_extraction"):
+                        found = reader.month_table(page)
+                    analyse_table = found[0] if found else None
+                elif not has_total_row(analyse_table):
+                    with stage("table_extraction"):
+                        rows = _continuation(reader.tables(page), len(analyse_table[0]))
+                    if rows is None:
+                        logger.debug("Tableau des mois interrompu sans ligne de totaux")
+                        break
+                    analyse_table = analyse_table + rows
+        finally:
+            reader.release(page)
+        if header_found and analyse_table is not None and has_total_row(analyse_table):
+            break
+    return "\n".join(texts), analyse_table
+
+def _rewind(pdf):
+    if hasattr(pdf, "seek"):
+        pdf.seek(0)
+
+def analyse_pdf_pdfplumber(pdf):
+    # Import différé : pdfplumber (et pdfminer) ne sont chargés qu'au premier fichier lu par ce moteur,
+    # le plus souvent lors d'un repli
+    import pdfplumber
+    _rewind(pdf)
+    with stage("pdf_open"):
+        pdf_obj = pdfplumber.open(pdf)
+    with pdf_obj:
+        return stream_report(pdf_obj.pages, PdfplumberPages)
+
+class PymupdfPages:
+    # Accès aux pages PyMuPDF, mêmes conventions que PdfplumberPages
+    @staticmethod
+    def size(page):
+        return page.rect.width, page.rect.height
+
+    @staticmethod
+    def text(page, clip=None, y_tolerance=3):
+        # Reconstruit les lignes comme pdfplumber : mots regroupés par ordonnée puis triés par abscisse
+        lines = []
+        words = page.get_text("words", clip=pymupdf.Rect(clip) if clip else None)
+        for x0, y0, x1, y1, word, *_ in sorted(words, key=lambda w: (w[3], w[0])):
+            if lines and abs(lines[-1][0] - y1) <= y_tolerance:
+                lines[-1][1].append((x0, word))
             else:
-                years = set()
-                # Si une période est fournie, extraire les années du premier et du dernier date
-                if period:
-                    parts = period.split()
-                    if len(parts) >= 9:
-                        date_N_1 = parts[1]
-                        date_N   = parts[8]
-                        compare_years = { date_N_1.split("/")[1], date_N.split("/")[1] }
-                    else:
-                        compare_years = set()
+                lines.append([y1, [(x0, word)]])
+        return "\n".join(" ".join(word for _, word in sorted(words)) for _, words in lines)
+
+    @staticmethod
+    def month_table(page, clip=None):
+        for table in page.find_tables(clip=pymupdf.Rect(clip) if clip else None).tables:
+            if not any(name and RULES.month_table_header in name.lower() for name in table.header.names):
+                continue
+            extracted = table.extract()
+            if is_month_table(extracted):
+                return extracted, tuple(table.bbox)
+        return None
+
+    @staticmethod
+    def tables(page):
+        return [table.extract() for table in sorted(page.find_tables().tables, key=lambda table: table.bbox[1])]
+
+    @staticmethod
+    def release(page):
+        # Les pages sont chargées à la demande par l'itération et libérées dès la suivante
+        pass
+
+def analyse_pdf_pymupdf(pdf):
+    _rewind(pdf)
+    with stage("pdf_open"):
+        if isinstance(pdf, str):
+            doc = pymupdf.open(pdf)
+        else:
+            doc = pymupdf.open(stream=pdf.read(), filetype="pdf")
+    with doc:
+        return stream_report(doc, PymupdfPages)
+
+# Moteurs d'analyse : chacun renvoie le texte des pages lues et le tableau "Analyse par mois de transport"
+BACKENDS = {
+    "pdfplumber": analyse_pdf_pdfplumber,
+    "pymupdf": analyse_pdf_pymupdf,
+}
+
+def available_backends():
+    return [name for name in BACKENDS if name != "pymupdf" or pymupdf is not None]
+
+def parse_report(text, analyse_table, period=None, rules=None):
+    # Renvoie les données extraites et un booléen indiquant si le tableau et sa ligne de totaux ont été lus
+    rules = rules or RULES
+    data = {}
+    complete = False
+
+    # Extraction du Nom du client
+    data['Nom du client'] = rules.find_client_name(text)
+
+    # Extraction des Comptes clients
+    comptes, comptes_end = rules.find_accounts(text)
+    data['Comptes clients'] = comptes
+    logger.debug(f"Comptes clients trouvés : {comptes}" if comptes_end is not None else "Comptes clients non trouvés")
+
+    # Extraction du Produit concerné (après les comptes s'ils ont été trouvés, sinon dans tout le texte)
+    produit, data['Produit concerné'] = rules.find_product(text, comptes_end or 0)
+    logger.debug(f"Produit extrait : {produit}" if produit is not None else "Produit non trouvé")
+
+    # Extraction des données du tableau (année, RC, Tonnage, CA)
+    if analyse_table:
+        logger.debug("Table 'Analyse par mois de transport' trouvée")
+        header_map = rules.map_headers(analyse_table[0], data.get('Produit concerné'))
+        logger.debug(f"Mapping des en-têtes : {header_map}")
+
+        if not all(k in header_map for k in ['RC', 'Tonnage', 'CA']):
+            data['RC'] = data['Tonnage'] = data['CA'] = 0
+        else:
+            years = set()
+            report_years = set()
+            # Si une période est fournie, extraire les années du premier et du dernier date
+            if period:
+                parts = period.split()
+                if len(parts) >= 9:
+                    date_N_1 = parts[1]
+                    date_N   = parts[8]
+                    compare_years = { date_N_1.split("/")[1], date_N.split("/")[1] }
                 else:
                     compare_years = set()
+            else:
+                compare_years = set()
 
-                for row in analyse_table[1:]:
-                    mois_val = row[0]
-                    if mois_val and mois_val.strip() and not mois_val.strip().lower().startswith("total"):
-                        match = re.search(r'(\d{4})', mois_val)
-                        if match:
-                            year = match.group(1)
-                            if not compare_years or year in compare_years:
-                                years.add(year)
-                data['Année'] = years.pop() if len(years) == 1 else None
-                total_row = None
-                for row in analyse_table:
-                    if row[0] and any(k.lower() in row[0].lower() for k in ['totaux', 'total']):
-                        total_row = row
-                        break
-                if total_row:
-                    try:
-                        data['RC'] = int(total_row[header_map['RC']].replace(',', '').strip())
-                        data['Tonnage'] = float(total_row[header_map['Tonnage']].replace(',', '.').strip())
-                        data['CA'] = float(total_row[header_map['CA']].replace(',', '.').strip())
-                    except Exception as e:
-                        print(f"Erreur extraction valeurs : {e}")
-                        data['RC'] = data['Tonnage'] = data['CA'] = 0
-                else:
+            for row in analyse_table[1:]:
+                mois_val = row[0]
+                if mois_val and mois_val.strip() and not rules.is_total_prefix(mois_val):
+                    year = rules.find_year(mois_val)
+                    if year:
+                        report_years.add(year)
+                    if year and (not compare_years or year in compare_years):
+                        years.add(year)
+            data['Année'] = years.pop() if len(years) == 1 else None
+            # Année couverte par le rapport lui-même, quelle que soit la période demandée : la plus récente du tableau
+            data['Année du rapport'] = max(report_years) if report_years else None
+            total_row = None
+            for row in analyse_table:
+                if rules.is_total(row[0]):
+                    total_row = row
+                    break
+            if total_row:
+                try:
+                    data['RC'] = int(total_row[header_map['RC']].replace(',', '').strip())
+                    data['Tonnage'] = float(total_row[header_map['Tonnage']].replace(',', '.').strip())
+                    data['CA'] = float(total_row[header_map['CA']].replace(',', '.').strip())
+                    complete = True
+                except Exception as e:
+                    logger.warning(f"Erreur extraction valeurs : {e}")
                     data['RC'] = data['Tonnage'] = data['CA'] = 0
-        else:
-            data['Année'] = None
-            data['RC'] = 0
-            data['Tonnage'] = 0.0
-            data['CA'] = 0
+            else:
+                data['RC'] = data['Tonnage'] = data['CA'] = 0
+    else:
+        data['Année'] = None
+        data['Année du rapport'] = None
+        data['RC'] = 0
+        data['Tonnage'] = 0.0
+        data['CA'] = 0
+    return data, complete
+
+def extract_data_from_pdf(pdf, period=None, backend=None):
+    backend = backend or config.EXTRACTION_BACKEND
+    if backend not in available_backends():
+        backend = "pdfplumber"
+    try:
+        text, analyse_table = BACKENDS[backend](pdf)
+        with stage("header_mapping"):
+            data, complete = parse_report(text, analyse_table, period)
+    except Exception as e:
+        if backend == "pdfplumber":
+            raise
+        # PDF mal formé ou inhabituel pour le moteur rapide (ouverture, détection des tableaux) : repli comme ci-dessous
+        logger.warning(f"Moteur {backend} en échec sur {getattr(pdf, 'name', pdf)} : {type(e).__name__}: {e}")
+        complete = False
+    fallback = False
+    if not complete and backend != "pdfplumber":
+        # Le moteur rapide n'a pas trouvé le tableau des mois ou la ligne de totaux : on repasse par pdfplumber
+        # (qui relit le fichier depuis le début)
+        logger.debug(f"Repli sur pdfplumber (moteur {backend} incomplet)")
+        text, analyse_table = BACKENDS["pdfplumber"](pdf)
+        with stage("header_mapping"):
+            data, complete = parse_report(text, analyse_table, period)
+        backend = "pdfplumber"
+        fallback = True
+    full_text = text
 
-        print(f"Fichier PDF: {pdf.name}")
-        print(f"Nom du client: {data.get('Nom du client')}")
-        return data, full_text
+    if config.LOG_PDF_TEXT:
+        logger.debug(f"Texte du PDF {getattr(pdf, 'name', pdf)} :\n{text}")
+
+    data['Moteur'] = backend
+    data['Repli'] = fallback
+    logger.debug(f"Fichier PDF: {getattr(pdf, 'name', pdf)} — Nom du client: {data.get('Nom du client')}")
+    return data, full_text
+
+def compare_backends(pdf, period=None, backends=None):
+    # Extrait le même fichier avec chaque moteur, sans repli, pour vérifier que les valeurs concordent
+    results = {}
+    for name in backends or available_backends():
+        text, analyse_table = BACKENDS[name](pdf)
+        results[name], _ = parse_report(text, analyse_table, period)
+    reference = results.get("pdfplumber")
+    mismatches = {}
+    if reference is not None:
+        for name, data in results.items():
+            diff = {k: (reference.get(k), data.get(k)) for k in ('Nom du client', 'Comptes clients', 'Produit concerné', 'Année', 'RC', 'Tonnage', 'CA')
+                    if reference.get(k) != data.get(k)}
+            if diff:
+                mismatches[name] = diff
+    return results, mismatches
 
 def validate_client_info(extracted_data):
     client_names = {data.get('Nom du client', '') for data in extracted_data}
@@ -145,3 +366,25 @@ def validate_client_info(extracted_data):
     if len(client_accounts) > 1:
         return False, "Les fichiers PDF contiennent des comptes clients différents."
     return True, ""
+
+if __name__ == "__main__":
+    # Usage : python extraction.py <période> fichier1.pdf ... — compare les moteurs fichier par fichier
+    import sys
+    import time
+    if len(sys.argv) < 3:
+        print("Usage : python extraction.py <période> <fichier.pdf> [...]")
+        sys.exit(1)
+    timings = {name: 0.0 for name in available_backends()}
+    nb_mismatch = 0
+    for path in sys.argv[2:]:
+        for name in timings:
+            start = time.perf_counter()
+            BACKENDS[name](path)
+            timings[name] += time.perf_counter() - start
+        _, mismatches = compare_backends(path, period=sys.argv[1])
+        if mismatches:
+            nb_mismatch += 1
+            print(f"{path} : écarts {mismatches}")
+    for name, elapsed in timings.items():
+        print(f"{name:<10} : {elapsed:.2f} s")
+    print(f"{nb_mismatch} fichier(s) avec écarts sur {len(sys.argv) - 2}")
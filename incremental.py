@@ -0,0 +1,199 @@
+# incremental.py
+import hashlib
+import json
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from cache import content_hash, get_default_cache
+import config
+from pipeline import read_upload, SharedPool, ContentExtraction, record_throughput, extract_one, spill_upload, discard_spill
+from template_writer import generate_report, report_values
+from instrumentation import stage, emit
+from records import RecordTable
+from store import get_default_store
+
+# État conservé entre deux exécutions du script Streamlit (une instance par session) : seuls les fichiers
+# nouveaux ou modifiés sont analysés, le classeur est repris de l'exécution précédente si les cumuls n'ont pas changé.
+# Les analyses tournent dans un pool de processus : une exécution interrompue par Streamlit (nouvel envoi,
+# clic) retrouve à la suivante les fichiers encore en cours.
+
+def upload_key(pdf_file, content):
+    # Identité du fichier (file_id Streamlit à défaut le nom) et empreinte de son contenu
+    identity = getattr(pdf_file, "file_id", None) or getattr(pdf_file, "name", "")
+    return identity, content_hash(content)
+
+class IncrementalReport:
+    def __init__(self):
+        self.pending = {}
+        self.extraction = None
+        self.executor = None
+        self.reset()
+
+    def reset(self, period=None):
+        for _, future, _ in self.pending.values():
+            future.cancel()
+        self.period = period
+        self.results = {}
+        self.pending = {}
+        # Tâches en cours : future -> (nom, contenu, soumissions déjà faites), pour les relancer sur un pool reconstruit
+        self.tasks = {}
+        self.keys = []
+        # Fichiers déjà cumulés, dans l'ordre du cumul
+        self.order = []
+        self.records = RecordTable()
+        self.stored = set()
+        self.report = None
+        self.report_signature = None
+
+    def submit(self, pdf_files, period, executor=None, cache=None):
+        # Met en file les fichiers nouveaux et renvoie leur nombre ; les fichiers déjà analysés ou en cours sont repris
+        if period != self.period:
+            # Les années retenues dépendent de la période : tout est à refaire
+            self.reset(period)
+        self.executor = executor or SharedPool()
+        self.extraction = ContentExtraction(period, cache if cache is not None else get_default_cache())
+        futures_by_digest = {key[1]: future for key, (_, future, _) in self.pending.items()}
+        keys = []
+        new = {}
+        for pdf_file in pdf_files:
+            name, content = read_upload(pdf_file)
+            key = upload_key(pdf_file, content)
+            keys.append(key)
+            if key not in self.results and key not in self.pending and key not in new:
+                new[key] = (name, content)
+        # Contenus déjà analysés dans la session (sous un autre nom ou file_id) : résultat repris tel quel. Un fichier
+        # en erreur est réanalysé, comme il ne passe pas par le cache.
+        completed = {key[1]: result for key, result in self.results.items() if result["error"] is None}
+        actions = self.extraction.plan([key[1] for key in new], futures_by_digest, completed)
+        for (key, (name, content)), (action, data) in zip(new.items(), actions):
+            if action == "cache":
+                self.results[key] = self.extraction.from_cache(name, data)
+                emit(self.results[key]["metrics"])
+            elif action == "duplicate" and data is not None:
+                self.results[key] = ContentExtraction.duplicate(name, data)
+                emit(self.results[key]["metrics"])
+            elif action == "duplicate":
+                # Même contenu déjà en cours sous un autre nom : une seule analyse
+                self.pending[key] = (name, futures_by_digest[key[1]], True)
+            else:
+                future = self._start(name, content)
+                futures_by_digest[key[1]] = future
+                self.pending[key] = (name, future, False)
+
+        # Fichiers retirés de l'envoi : analyses abandonnées (si aucun fichier restant ne les attend) et résultats oubliés
+        removed = [key for key in self.pending if key not in keys]
+        for key in removed:
+            _, future, _ = self.pending.pop(key)
+            if all(other is not future for _, other, _ in self.pending.values()):
+                future.cancel()
+                self.tasks.pop(future, None)
+        for key in [key for key in self.results if key not in keys]:
+            del self.results[key]
+        self.keys = keys
+        return len(new)
+
+    def _start(self, name, content, attempts=0):
+        if len(content) > config.UPLOAD_SPILL_BYTES:
+            # Gros fichier : passé au processus fils par un fichier temporaire, supprimé à la fin de l'analyse
+            path = spill_upload(content)
+            future = self.executor.submit(extract_one, name, path, self.period)
+            future.add_done_callback(lambda _, path=path: discard_spill(path))
+        else:
+            # Le contenu n'est copié que vers le processus fils (sérialisation du pool), pas dans le parent
+            future = self.executor.submit(extract_one, name, content, self.period)
+        self.tasks[future] = (name, content, attempts + 1)
+        return future
+
+    def _retry(self, future, extracted, keys):
+        # Pool cassé par la mort d'un processus fils, peut-être pendant l'analyse d'un fichier d'une autre session :
+        # la tâche est soumise à nouveau (SharedPool reconstruit le pool) ; renvoie la nouvelle future ou None
+        name, content, attempts = self.tasks.pop(future, (None, None, 0))
+        if not isinstance(extracted, BrokenProcessPool) or name is None or attempts > config.POOL_TASK_RETRIES:
+            return None
+        retry = self._start(name, content, attempts)
+        for key in keys:
+            self.pending[key] = (self.pending[key][0], retry, self.pending[key][2])
+        return retry
+
+    def iter_completed(self):
+        # Renvoie (indice du fichier, résultat) au fur et à mesure de la fin des analyses en cours
+        positions = {key: idx for idx, key in enumerate(self.keys)}
+        waiting = {}
+        for key, (_, future, _) in self.pending.items():
+            waiting.setdefault(future, []).append(key)
+        while waiting:
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                keys = waiting.pop(future)
+                try:
+                    extracted = future.result()
+                except Exception as e:
+                    extracted = e
+                retry = self._retry(future, extracted, keys)
+                if retry is not None:
+                    waiting[retry] = keys
+                    continue
+                yield from self._complete(keys, extracted, positions)
+
+    def _complete(self, keys, extracted, positions):
+        analysed = None
+        for key in keys:
+            name, _, duplicate = self.pending.pop(key)
+            if duplicate and analysed is not None:
+                result = ContentExtraction.duplicate(name, analysed)
+            else:
+                result = analysed = self.extraction.finish(name, key[1], extracted)
+                record_throughput(result["metrics"])
+            emit(result["metrics"])
+            self.results[key] = result
+            yield positions[key], result
+
+    def completed(self):
+        # Résultats déjà disponibles, par indice de fichier
+        return {idx: self.results[key] for idx, key in enumerate(self.keys) if key in self.results}
+
+    def finalize(self):
+        # Attend les analyses restantes puis agrège ; renvoie les résultats dans l'ordre des fichiers
+        for _ in self.iter_completed():
+            pass
+        results = [self.results[key] for key in self.keys]
+        added = set(self.keys).difference(self.order)
+        with stage("aggregation"):
+            if self.keys[:len(self.order)] == self.order:
+                # Fichiers uniquement ajoutés en fin de liste : seuls les nouveaux résultats sont cumulés, en place,
+                # dans le même ordre d'addition qu'un calcul complet
+                for key in self.keys[len(self.order):]:
+                    if self.results[key]["error"] is None:
+                        self.records.append(self.results[key]["data"])
+            else:
+                # Fichiers retirés ou réordonnés : cumul vectorisé à partir des résultats mémorisés, sans réanalyser
+                self.records = RecordTable.from_records(result["data"] for result in results if result["error"] is None)
+        self.order = list(self.keys)
+        if added:
+            self.save_records()
+        return results
+
+    def save_records(self, store=None):
+        # Enregistre dans la base les résultats pas encore enregistrés (une transaction par exécution)
+        store = store if store is not None else get_default_store()
+        if store is None:
+            return 0
+        items = [(key[1], self.results[key]["data"], self.results[key]["name"]) for key in self.keys
+                 if key in self.results and self.results[key]["error"] is None and key[1] not in self.stored]
+        with stage("store"):
+            store.add_many(items)
+        self.stored.update(digest for digest, _, _ in items)
+        return len(items)
+
+    def update(self, pdf_files, period, executor=None):
+        # Version bloquante : renvoie les résultats dans l'ordre des fichiers et le nombre de fichiers nouveaux
+        nb_new = self.submit(pdf_files, period, executor)
+        return self.finalize(), nb_new
+
+    def workbook(self, client_info):
+        # Le classeur n'est régénéré que si les cellules à écrire (chiffres cumulés, informations client) ont changé
+        values = report_values(self.records, client_info)
+        signature = hashlib.sha256(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+        if signature != self.report_signature:
+            self.report = generate_report(self.records, client_info)
+            self.report_signature = signature
+        return self.report
@@ -0,0 +1,116 @@
+# instrumentation.py
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+import config
+
+# Mesure des temps par étape (ouverture PDF, texte, tableaux, en-têtes, agrégation, template, remplissage,
+# sauvegarde) et journalisation d'enregistrements JSON. Sans trace active, stage() ne mesure rien.
+# Un profileur par étape (profiling.py) peut être attaché au contexte : sans lui, aucun coût supplémentaire.
+
+logger = logging.getLogger("analyses_flux")
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_profiler = contextvars.ContextVar("current_profiler", default=None)
+
+class Trace:
+    def __init__(self, event, **fields):
+        self.event = event
+        self.fields = fields
+        self.timings = {}
+        self.start = time.perf_counter()
+        self.total = None
+
+    def add(self, stage_name, elapsed):
+        self.timings[stage_name] = self.timings.get(stage_name, 0.0) + elapsed
+
+    def record(self):
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        return {
+            "event": self.event,
+            **self.fields,
+            "timings_ms": {name: round(elapsed * 1000, 3) for name, elapsed in self.timings.items()},
+            "total_ms": round(total * 1000, 3),
+        }
+
+@contextmanager
+def trace(event, **fields):
+    current = Trace(event, **fields)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current.total = time.perf_counter() - current.start
+        _current_trace.reset(token)
+
+@contextmanager
+def stage(name):
+    current = _current_trace.get()
+    if current is None:
+        yield
+        return
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.enter(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add(name, time.perf_counter() - start)
+        if profiler is not None:
+            profiler.exit()
+
+@contextmanager
+def profiled(profiler):
+    # Rattache les étapes exécutées dans ce contexte au profileur (profiling.StageProfiler)
+    token = _current_profiler.set(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _current_profiler.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+def emit(record):
+    if config.METRICS_LOG:
+        logger.info(record.get("event", "metrics"), extra={"metrics": record})
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        metrics = getattr(record, "metrics", None)
+        if metrics is not None:
+            payload.update(metrics)
+        else:
+            payload["message"] = record.getMessage()
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+def configure_logging(level=None):
+    # Idempotent : un seul gestionnaire JSON sur le logger de l'application
+    if not any(isinstance(handler.formatter, JsonFormatter) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level or config.LOG_LEVEL)
+    return logger
+
+def timings_table(records):
+    # Lignes prêtes à afficher (un enregistrement par ligne, une colonne par étape)
+    rows = []
+    for record in records:
+        row = {key: value for key, value in record.items() if key not in ("timings_ms",)}
+        for name, elapsed in record.get("timings_ms", {}).items():
+            row[f"{name} (ms)"] = elapsed
+        rows.append(row)
+    return rows
@@ -0,0 +1,416 @@
+# jobs.py
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import config
+from instrumentation import configure_logging, logger, trace, emit
+
+# File de tâches durable (SQLite) et service de traitement. L'application et la ligne de commande déposent des
+# tâches d'extraction (PDF -> un classeur par client) ou d'addition (classeurs préremplis -> un classeur combiné) ;
+# les processus du service les exécutent et conservent les classeurs produits, récupérables par identifiant.
+# Une tâche dont le processus ne donne plus signe de vie depuis JOB_STALE_S est remise en file.
+
+KINDS = ("extraction", "combine")
+FINAL_STATUSES = ("done", "error", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    params TEXT NOT NULL DEFAULT '{}',
+    total INTEGER NOT NULL DEFAULT 0,
+    progress INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    summary TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    heartbeat REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS job_outputs (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (job_id, filename)
+);
+"""
+
+class JobCancelled(Exception):
+    pass
+
+def _input_file(item):
+    # (nom, chemin ou contenu) : chemin, fichier envoyé (UploadedFile, fichier ouvert) ou couple (nom, contenu)
+    if isinstance(item, tuple):
+        return item
+    if isinstance(item, (str, os.PathLike)):
+        return os.path.basename(item), item
+    if hasattr(item, "getvalue"):
+        return getattr(item, "name", "fichier"), item.getvalue()
+    item.seek(0)
+    return getattr(item, "name", "fichier"), item.read()
+
+def _safe_name(name):
+    return re.sub(r'[\\/:*?"<>|]', "_", os.path.basename(name)).strip() or "fichier"
+
+class JobQueue:
+    def __init__(self, path=None, directory=None):
+        self.path = path or config.JOB_QUEUE_PATH
+        self.directory = directory or config.JOB_DIR
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        os.makedirs(self.directory, exist_ok=True)
+        # Mode autocommit : les transactions explicites (BEGIN IMMEDIATE) protègent la prise d'une tâche
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        # Connexion partagée entre les sessions qui déposent et suivent des tâches et les threads du service ; le
+        # verrou empêche une requête d'un autre thread de s'intercaler dans les transactions de claim et complete
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params)
+
+    def job_dir(self, job_id, part=""):
+        return os.path.join(self.directory, job_id, part)
+
+    def submit(self, kind, files, params=None):
+        # Copie les fichiers d'entrée dans le répertoire de la tâche puis la met en file ; renvoie son identifiant
+        if kind not in KINDS:
+            raise ValueError(f"Type de tâche inconnu : {kind}")
+        job_id = uuid.uuid4().hex
+        inputs = self.job_dir(job_id, "inputs")
+        os.makedirs(inputs)
+        count = 0
+        for position, item in enumerate(files):
+            name, source = _input_file(item)
+            # Préfixe de position : l'ordre d'envoi est conservé par le parcours trié des fichiers
+            path = os.path.join(inputs, f"{position:05d}_{_safe_name(name)}")
+            if isinstance(source, (str, os.PathLike)):
+                shutil.copyfile(source, path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(source)
+            count += 1
+        self._execute("INSERT INTO jobs (id, kind, params, total, created) VALUES (?, ?, ?, ?, ?)",
+                      (job_id, kind, json.dumps(params or {}, ensure_ascii=False), count, time.time()))
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            cursor = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job["params"] = json.loads(job["params"])
+        job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+        job["outputs"] = [filename for filename, _ in self.outputs(job_id)]
+        return job
+
+    def recent(self, limit=20):
+        ids = [row[0] for row in self._execute("SELECT id FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()]
+        return [self.get(job_id) for job_id in ids]
+
+    def claim(self, worker):
+        # Prend la plus ancienne tâche en file (None si la file est vide) ; une seule prise par tâche
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+                if row is not None:
+                    self.conn.execute("UPDATE jobs SET status = 'running', worker = ?, started = ?, heartbeat = ?, "
+                                      "progress = 0, attempts = attempts + 1 WHERE id = ?", (worker, now, now, row[0]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def heartbeat(self, job_id, progress=None):
+        # Signe de vie (et avancement) d'une tâche en cours ; False si elle a été annulée entre-temps
+        if progress is None:
+            cursor = self._execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                                   (time.time(), job_id))
+        else:
+            cursor = self._execute("UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ? AND status = 'running'",
+                                   (time.time(), progress, job_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, filenames, summary=None):
+        output_dir = self.job_dir(job_id, "output")
+        sizes = [(job_id, filename, os.path.getsize(os.path.join(output_dir, filename))) for filename in filenames]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("INSERT OR REPLACE INTO job_outputs VALUES (?, ?, ?)", sizes)
+                self.conn.execute("UPDATE jobs SET status = 'done', progress = total, summary = ?, finished = ? "
+                                  "WHERE id = ? AND status = 'running'",
+                                  (json.dumps(summary or {}, ensure_ascii=False), time.time(), job_id))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def fail(self, job_id, error):
+        self._execute("UPDATE jobs SET status = 'error', error = ?, finished = ? WHERE id = ? AND status = 'running'",
+                      (error, time.time(), job_id))
+
+    def cancel(self, job_id):
+        # Une tâche en cours s'arrête au prochain fichier traité
+        cursor = self._execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                               "WHERE id = ? AND status IN ('queued', 'running')", (time.time(), job_id))
+        return cursor.rowcount == 1
+
+    def requeue_stale(self, stale_s=None):
+        # Tâches "en cours" sans signe de vie (processus arrêté) : remises en file, ou en erreur après JOB_MAX_ATTEMPTS
+        limit = time.time() - (config.JOB_STALE_S if stale_s is None else stale_s)
+        with_error = self._execute(
+            "UPDATE jobs SET status = 'error', error = 'processus de traitement arrêté', finished = ? "
+            "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?", (time.time(), limit, config.JOB_MAX_ATTEMPTS))
+        requeued = self._execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?", (limit,))
+        return requeued.rowcount, with_error.rowcount
+
+    def purge(self, retention_s=None):
+        # Supprime les tâches terminées depuis plus de JOB_RETENTION_S, avec leurs fichiers
+        limit = time.time() - (config.JOB_RETENTION_S if retention_s is None else retention_s)
+        placeholders = ", ".join("?" * len(FINAL_STATUSES))
+        ids = [row[0] for row in self._execute(
+            f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished < ?", (*FINAL_STATUSES, limit)).fetchall()]
+        for job_id in ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(ids)
+
+    def outputs(self, job_id):
+        # [(nom de fichier, chemin)] des classeurs produits
+        output_dir = self.job_dir(job_id, "output")
+        return [(filename, os.path.join(output_dir, filename)) for (filename,) in self._execute(
+            "SELECT filename FROM job_outputs WHERE job_id = ? ORDER BY filename", (job_id,)).fetchall()]
+
+    def read_output(self, job_id, filename):
+        with open(os.path.join(self.job_dir(job_id, "output"), _safe_name(filename)), "rb") as f:
+            return f.read()
+
+    def write_archive(self, job_id, fileobj):
+        # Tous les classeurs de la tâche dans une archive ZIP, lus un par un
+        from multi_client import write_zip
+        def reports():
+            for filename, path in self.outputs(job_id):
+                with open(path, "rb") as f:
+                    yield filename, f.read()
+        return write_zip(reports(), fileobj)
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+def get_default_queue():
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
+
+class _Heartbeat:
+    # Signe de vie périodique pendant l'exécution d'une tâche (les étapes longues ne rendent pas la main)
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        queue = JobQueue()
+        try:
+            while not self.stopped.wait(config.JOB_HEARTBEAT_S):
+                queue.heartbeat(self.job_id)
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+def run_job(queue, job):
+    # Exécute une tâche et renvoie (classeurs produits, résumé)
+    job_id = job["id"]
+    inputs = queue.job_dir(job_id, "inputs")
+    output_dir = queue.job_dir(job_id, "output")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    def progress(nb_files):
+        if not queue.heartbeat(job_id, nb_files):
+            raise JobCancelled(job_id)
+
+    if job["kind"] == "extraction":
+        from batch import run_batch
+        report = run_batch(inputs, job["params"]["period"], output_dir, max_workers=config.JOB_EXTRACTION_WORKERS,
+                           recursive=False, log=logger.info, progress=progress,
+                           output_format=job["params"].get("format", "xlsx"))
+        filenames = [os.path.basename(path) for path in report.pop("workbooks")]
+        return filenames, report
+    from excel_reader import combined_report
+    paths = sorted(glob.glob(os.path.join(inputs, "*")))
+    filename, content = combined_report(paths)
+    filename = _safe_name(filename)
+    with open(os.path.join(output_dir, filename), "wb") as f:
+        f.write(content)
+    return [filename], {"files": len(paths)}
+
+def process_job(queue, job):
+    with trace("job", job_id=job["id"], kind=job["kind"], files=job["total"], attempt=job["attempts"]) as job_trace:
+        try:
+            with _Heartbeat(job["id"]):
+                filenames, summary = run_job(queue, job)
+            queue.complete(job["id"], filenames, summary)
+            outcome = "done"
+        except JobCancelled:
+            outcome = "cancelled"
+        except Exception as e:
+            logger.exception(f"Échec de la tâche {job['id']}")
+            queue.fail(job["id"], f"{type(e).__name__}: {e}")
+            outcome = "error"
+    record = job_trace.record()
+    record["outcome"] = outcome
+    emit(record)
+    return outcome
+
+def work_loop(name=None, stop_when_empty=False):
+    # Boucle d'un processus de traitement : une tâche à la fois, la plus ancienne d'abord
+    configure_logging()
+    queue = JobQueue()
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        job = queue.claim(name)
+        if job is None:
+            if stop_when_empty:
+                return
+            time.sleep(config.JOB_POLL_INTERVAL_S)
+            continue
+        process_job(queue, job)
+
+def serve(workers=None):
+    # Service : workers processus de traitement, relancés s'ils s'arrêtent ; surveillance des tâches abandonnées
+    # et purge des anciennes tâches dans le processus principal
+    workers = workers or config.JOB_WORKERS or os.cpu_count() or 1
+    queue = JobQueue()
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    logger.info(f"Service de tâches : {workers} processus, file {os.path.abspath(queue.path)}")
+    last_purge = 0.0
+    try:
+        while True:
+            for slot in range(workers):
+                process = processes.get(slot)
+                if process is None or not process.is_alive():
+                    process = context.Process(target=work_loop, args=(f"{socket.gethostname()}:{os.getpid()}-{slot}",))
+                    process.start()
+                    processes[slot] = process
+            requeued, failed = queue.requeue_stale()
+            if requeued or failed:
+                logger.warning(f"Tâches abandonnées : {requeued} remise(s) en file, {failed} en erreur")
+            if time.time() - last_purge > 3600:
+                queue.purge()
+                last_purge = time.time()
+            time.sleep(max(config.JOB_POLL_INTERVAL_S, 1.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+def _expand(paths, extension):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, f"*{extension}")))
+        else:
+            files.append(path)
+    return files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="File de tâches d'extraction et d'addition, et service de traitement.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Démarrer le service de traitement")
+    serve_parser.add_argument("--workers", type=int, default=None, help="Nombre de processus (défaut : config.JOB_WORKERS ou nombre de cœurs)")
+    submit_parser = commands.add_parser("submit", help="Déposer une tâche")
+    submit_parser.add_argument("kind", choices=KINDS)
+    submit_parser.add_argument("files", nargs="+", help="Fichiers ou répertoires (PDF pour l'extraction, .xlsx pour l'addition)")
+    submit_parser.add_argument("--period", help='Période de l\'extraction, ex. "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024"')
+    submit_parser.add_argument("--format", choices=("xlsx", "csv", "parquet"), default="xlsx",
+                               help="Sortie de l'extraction : classeurs (défaut) ou table à plat csv / parquet")
+    status_parser = commands.add_parser("status", help="État d'une tâche")
+    status_parser.add_argument("job_id")
+    fetch_parser = commands.add_parser("fetch", help="Récupérer les classeurs d'une tâche terminée")
+    fetch_parser.add_argument("job_id")
+    fetch_parser.add_argument("--output", default="sorties", help="Répertoire de sortie (défaut : sorties)")
+    cancel_parser = commands.add_parser("cancel", help="Annuler une tâche")
+    cancel_parser.add_argument("job_id")
+    list_parser = commands.add_parser("list", help="Dernières tâches")
+    list_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if args.command == "serve":
+        serve(args.workers)
+        return 0
+    queue = get_default_queue()
+    if args.command == "submit":
+        if args.kind == "extraction" and not args.period:
+            parser.error("--period est obligatoire pour une extraction")
+        files = _expand(args.files, ".pdf" if args.kind == "extraction" else ".xlsx")
+        params = {"period": args.period, "format": args.format} if args.kind == "extraction" else {}
+        print(queue.submit(args.kind, files, params))
+        return 0
+    if args.command == "list":
+        for job in queue.recent(args.limit):
+            print(f"{job['id']}  {job['kind']:<10} {job['status']:<9} {job['progress']}/{job['total']}  "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job['created']))}")
+        return 0
+    job = queue.get(args.job_id)
+    if job is None:
+        print(f"Tâche inconnue : {args.job_id}")
+        return 1
+    if args.command == "status":
+        print(json.dumps(job, ensure_ascii=False, indent=2))
+        return 0
+    if args.command == "cancel":
+        return 0 if queue.cancel(args.job_id) else 1
+    if job["status"] != "done":
+        print(f"Tâche {args.job_id} : {job['status']}{' — ' + job['error'] if job['error'] else ''}")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    for filename, path in queue.outputs(args.job_id):
+        shutil.copyfile(path, os.path.join(args.output, filename))
+        print(os.path.join(args.output, filename))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# load_test.py
+import argparse
+import io
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+import config
+
+# Test de charge local : N sessions simultanées, chacune dans son propre thread comme sous le serveur Streamlit,
+# envoient leurs PDF au pool partagé puis génèrent leur classeur (ou combinent leurs classeurs en mode addition).
+# Chaque session a son propre client : ses résultats et son classeur doivent être identiques à ceux calculés
+# seuls, sans aucune donnée d'une autre session. Mesure le débit et les latences p50 / p95 par envoi.
+# Avec kill_worker, un processus du pool partagé meurt au milieu du premier envoi de la session 0 : toutes les
+# sessions, y compris celles dont les fichiers étaient en cours sur ce pool, doivent terminer sans erreur.
+
+MODES = ("pdf", "addition")
+
+def percentile(values, q):
+    # Rang le plus proche, sur une liste déjà triée
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+def workbook_parts(content):
+    # Contenu des parties du classeur, hors horodatages (date des entrées ZIP, propriétés du document)
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        return {name: archive.read(name) for name in archive.namelist() if name != "docProps/core.xml"}
+
+def session_client(session):
+    return f"SESSION {session:03d}", [str(900000 + session)]
+
+def session_batches(session, rounds, nb_files, seed=0, year=2024):
+    # Un lot de PDF distincts par envoi : [(nom, contenu, attendu)] ; produits et années tournent
+    from synthetic_pdf import make_report_pdf
+    client, comptes = session_client(session)
+    keys = list(config.PRODUCT_MAPPING)
+    batches = []
+    for number in range(rounds):
+        batch = []
+        for idx in range(nb_files):
+            content, expected = make_report_pdf(client, comptes, keys[idx % len(keys)], year - (idx // len(keys)) % 2,
+                                                seed=(seed * 1000 + session) * 100003 + number * 1000 + idx)
+            batch.append((f"s{session:03d}_r{number:02d}_{idx:03d}.pdf", content, expected))
+        batches.append(batch)
+    return batches
+
+def expected_report(session, batch, period):
+    # Classeur de référence, généré hors charge à partir des valeurs attendues
+    from records import RecordTable
+    from template_writer import generate_report
+    client, comptes = session_client(session)
+    client_info = {"Nom du client": client, "Comptes clients": comptes, "Périodicité": period}
+    report = generate_report(RecordTable.from_records(expected for _, _, expected in batch), client_info, use_cache=False)
+    return workbook_parts(report), client_info
+
+def _upload(name, content, session):
+    upload = io.BytesIO(content)
+    upload.name = name
+    upload.file_id = f"{session}-{name}"
+    return upload
+
+def kill_pool_worker():
+    # Tâche qui tue le processus du pool qui l'exécute, comme un plantage (mémoire, segfault) : le pool est cassé
+    # et toutes ses tâches en cours échouent
+    from pipeline import SharedPool
+    return SharedPool().submit(os._exit, 1)
+
+def _pdf_request(session, batch, reference, period, kill_worker=False):
+    # Un envoi tel que l'application le traite : état propre à la session, pool et cache partagés
+    from incremental import IncrementalReport
+    report, client_info = reference
+    incremental = IncrementalReport()
+    incremental.submit([_upload(name, content, session) for name, content, _ in batch], period)
+    if kill_worker:
+        kill_pool_worker()
+    results = incremental.finalize()
+    content = incremental.workbook(client_info)
+    problems = []
+    for (name, _, expected), result in zip(batch, results):
+        if result["error"]:
+            problems.append(f"{name} : {result['error']}")
+        elif any(result["data"].get(key) != value for key, value in expected.items()):
+            problems.append(f"{name} : valeurs de {result['data'].get('Nom du client')} au lieu de {client_info['Nom du client']}")
+    if workbook_parts(content) != report:
+        problems.append("classeur différent de la référence")
+    return problems
+
+def _addition_request(session, batch, reference, period, kill_worker=False):
+    from excel_reader import combined_report
+    expected, xlsx_files = reference
+    _, content = combined_report([_upload(name, data, session) for name, data in xlsx_files])
+    return [] if workbook_parts(content) == expected else ["classeur combiné différent de la référence"]
+
+def _addition_reference(session, batch, period):
+    # Classeurs préremplis de l'envoi (un par PDF) et classeur combiné attendu, calculés hors charge
+    from excel_reader import combined_report
+    from records import RecordTable
+    from template_writer import generate_report
+    client, comptes = session_client(session)
+    xlsx_files = []
+    for name, _, expected in batch:
+        client_info = {"Nom du client": client, "Comptes clients": comptes, "Périodicité": period}
+        xlsx_files.append((name[:-4] + ".xlsx", generate_report(RecordTable.from_records([expected]), client_info,
+                                                                use_cache=False)))
+    _, content = combined_report([_upload(name, data, "reference") for name, data in xlsx_files])
+    return workbook_parts(content), xlsx_files
+
+def run_load_test(sessions=8, rounds=3, nb_files=12, mode="pdf", seed=0, max_workers=None, kill_worker=False, log=print):
+    # Renvoie les mesures : débit, latences, envois en erreur ou contenant des données d'une autre session.
+    # kill_worker (mode pdf) : un processus du pool meurt pendant le premier envoi de la session 0.
+    from synthetic_pdf import corpus_period
+    from pipeline import SharedPool
+    warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+    period = corpus_period()
+    log(f"Préparation : {sessions} sessions x {rounds} envois x {nb_files} fichiers ({mode})")
+    work = []
+    for session in range(sessions):
+        for batch in session_batches(session, rounds, nb_files, seed):
+            if mode == "pdf":
+                work.append((session, batch, expected_report(session, batch, period)))
+            else:
+                work.append((session, batch, _addition_reference(session, batch, period)))
+    request = _pdf_request if mode == "pdf" else _addition_request
+    if mode == "pdf":
+        # Pool démarré avant la mesure, comme dans l'application déjà lancée
+        SharedPool(max_workers).submit(int).result()
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(sessions)
+
+    def session_thread(session):
+        barrier.wait()
+        for number, (_, batch, reference) in enumerate(item for item in work if item[0] == session):
+            start = time.perf_counter()
+            try:
+                problems = request(session, batch, reference, period, kill_worker and session == 0 and number == 0)
+            except Exception as e:
+                problems = [f"{type(e).__name__}: {e}"]
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                failures.extend(f"session {session} : {problem}" for problem in problems)
+
+    threads = [threading.Thread(target=session_thread, args=(session,)) for session in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "requests": len(latencies),
+        "files": len(latencies) * nb_files,
+        "elapsed_s": elapsed,
+        "files_per_s": len(latencies) * nb_files / elapsed if elapsed else 0.0,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "failures": failures,
+    }
+
+def check_store(store, sessions, rounds, nb_files):
+    # Chaque session retrouve dans la base partagée exactement ses fichiers, sous son client
+    expected = {session_client(session)[0]: rounds * nb_files for session in range(sessions)}
+    found = {client_name: count for client_name, _, count, _ in store.clients()}
+    return [f"base : {client_name} {found.get(client_name, 0)} fichiers au lieu de {count}"
+            for client_name, count in expected.items() if found.get(client_name, 0) != count] + \
+           [f"base : client inattendu {client_name}" for client_name in found if client_name not in expected]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge : sessions simultanées sur le pipeline partagé.")
+    parser.add_argument("--sessions", type=int, default=8, help="Nombre de sessions simultanées (défaut : 8)")
+    parser.add_argument("--rounds", type=int, default=3, help="Envois successifs par session (défaut : 3)")
+    parser.add_argument("--files", type=int, default=12, help="Fichiers par envoi (défaut : 12)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="Chemins testés (défaut : tous)")
+    parser.add_argument("--workers", type=int, default=None, help="Processus d'extraction (défaut : config)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur de PDF")
+    parser.add_argument("--kill-worker", action="store_true",
+                        help="Tue un processus du pool pendant le premier envoi de la session 0 (mode pdf)")
+    args = parser.parse_args(argv)
+
+    # Cache et base dans un répertoire temporaire : partagés par les sessions comme dans l'application, sans
+    # toucher aux données réelles
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    config.EXTRACTION_CACHE_DIR = os.path.join(workdir, "cache")
+    config.RECORD_STORE_PATH = os.path.join(workdir, "records.sqlite3")
+    failed = False
+    try:
+        for mode in args.modes:
+            result = run_load_test(args.sessions, args.rounds, args.files, mode, args.seed, args.workers,
+                                   args.kill_worker)
+            failures = result["failures"]
+            if mode == "pdf":
+                from store import get_default_store
+                failures += check_store(get_default_store(), args.sessions, args.rounds, args.files)
+            print(f"{mode:<9} {result['requests']} envois en {result['elapsed_s']:.2f} s — "
+                  f"{result['files_per_s']:.1f} fichiers/s, {result['requests_per_s']:.2f} envois/s, "
+                  f"p50 {result['p50_s'] * 1000:.0f} ms, p95 {result['p95_s'] * 1000:.0f} ms, "
+                  f"{len(failures)} anomalie(s)")
+            for failure in failures:
+                print(f"  FUITE OU ERREUR {failure}")
+            failed = failed or bool(failures)
+    finally:
+        from store import get_default_store
+        get_default_store().close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# multi_client.py
+import os
+import re
+import zipfile
+import config
+from cache import get_report_cache
+from template_writer import generate_report, get_compiled_template, report_values, output_key
+from instrumentation import trace, emit
+
+# Envoi mélangeant plusieurs clients : un classeur par client (nom, ensemble des comptes), générés en parallèle
+# dans des processus séparés, puis livrés dans une archive ZIP écrite au fil de l'eau ou réunis dans un seul
+# classeur avec une feuille "KPI activité client" par client.
+
+SHEET_NAME_MAX = 31
+
+def output_filename(client_name, accounts, duplicate_name=False):
+    safe_name = re.sub(r'[\\/:*?"<>|]', "_", client_name or "Client inconnu").strip()
+    if duplicate_name and accounts:
+        return f"ANALYSES DES FLUX {safe_name} ({'-'.join(accounts)}).xlsx"
+    return f"ANALYSES DES FLUX {safe_name}.xlsx"
+
+def unique_filename(filename, used):
+    # Deux clients peuvent donner le même nom de fichier une fois les caractères interdits remplacés : le second
+    # reçoit un suffixe " (2)", " (3)"... La casse est ignorée, comme sur les systèmes de fichiers Windows et macOS.
+    stem, ext = os.path.splitext(filename)
+    candidate = filename
+    number = 2
+    while candidate.lower() in used:
+        candidate = f"{stem} ({number}){ext}"
+        number += 1
+    used.add(candidate.lower())
+    return candidate
+
+def client_jobs(totals, period, clients=None):
+    # [(nom de fichier, client_info, cumuls)] : totals vient de RecordTable.by_client() ; clients fixe l'ordre
+    # et peut contenir des clients sans cumul (fichiers dont le produit ou l'année n'a pas été reconnu)
+    clients = list(totals) if clients is None else list(clients)
+    names = [name for name, _ in clients]
+    used = set()
+    jobs = []
+    for client_name, accounts in clients:
+        client_info = {
+            "Nom du client": client_name,
+            "Comptes clients": list(accounts),
+            "Périodicité": period,
+        }
+        filename = unique_filename(output_filename(client_name, accounts, names.count(client_name) > 1), used)
+        jobs.append((filename, client_info, totals.get((client_name, accounts), {})))
+    return jobs
+
+def _render_job(job):
+    # Exécuté dans un processus fils : le template compilé est chargé une fois par processus
+    filename, client_info, totals = job
+    with trace("report", client=client_info["Nom du client"], file=filename) as report_trace:
+        content = generate_report(totals, client_info)
+    return filename, content, report_trace.record()
+
+def generate_reports(jobs, max_workers=None, executor=None):
+    # Renvoie (nom de fichier, contenu) dans l'ordre des clients, au fur et à mesure de la génération.
+    # En dessous de MULTI_CLIENT_PARALLEL_MIN clients, la génération reste dans le processus courant.
+    from pipeline import resolve_workers, process_pool
+    workers = resolve_workers(max_workers, len(jobs))
+    if workers == 1 or len(jobs) < config.MULTI_CLIENT_PARALLEL_MIN:
+        rendered = map(_render_job, jobs)
+    elif executor is not None:
+        rendered = executor.map(_render_job, jobs, chunksize=_chunksize(len(jobs), workers))
+    else:
+        with process_pool(workers) as pool:
+            yield from generate_reports(jobs, max_workers, pool)
+        return
+    for filename, content, record in rendered:
+        emit(record)
+        yield filename, content
+
+def _chunksize(nb_jobs, workers):
+    # Quelques lots par processus : moins d'allers-retours sans déséquilibrer la fin du traitement
+    return max(1, nb_jobs // (workers * 4))
+
+def write_zip(reports, fileobj):
+    # Chaque classeur est ajouté à l'archive dès qu'il est prêt ; les .xlsx étant déjà compressés, ils sont
+    # stockés tels quels. Renvoie les noms écrits.
+    names = []
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED) as archive:
+        for filename, content in reports:
+            archive.writestr(filename, content)
+            names.append(filename)
+    return names
+
+def sheet_names(jobs):
+    # Noms de feuille Excel : caractères interdits remplacés, 31 caractères au plus, sans doublon (casse ignorée)
+    names = []
+    used = set()
+    for _, client_info, _ in jobs:
+        base = re.sub(r"[\\/:*?\[\]]", "_", client_info["Nom du client"] or "Client inconnu").strip("' ") or "Client"
+        name = base[:SHEET_NAME_MAX]
+        number = 2
+        while name.lower() in used:
+            suffix = f" ({number})"
+            name = base[:SHEET_NAME_MAX - len(suffix)] + suffix
+            number += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+def multi_sheet_workbook(jobs):
+    # Un seul classeur, une feuille "KPI activité client" (graphiques compris) par client
+    with trace("report", clients=len(jobs), sheets=True) as report_trace:
+        sheets = [(name, report_values(totals, client_info))
+                  for name, (_, client_info, totals) in zip(sheet_names(jobs), jobs)]
+        cache = get_report_cache()
+        if cache is None:
+            content = get_compiled_template().render_workbook(sheets)
+        else:
+            content = cache.get_or_create(output_key("workbook", sheets),
+                                          lambda: get_compiled_template().render_workbook(sheets))
+    emit(report_trace.record())
+    return content
@@ -0,0 +1,373 @@
+# pipeline.py
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from extraction import extract_data_from_pdf
+from cache import cache_key, content_hash, file_hash, get_default_cache
+from instrumentation import trace, emit
+import config
+
+def resolve_workers(max_workers=None, nb_files=None):
+    workers = max_workers or config.EXTRACTION_WORKERS or os.cpu_count() or 1
+    if nb_files is not None:
+        workers = min(workers, nb_files)
+    return max(1, workers)
+
+_shared_pool = None
+# Temps d'extraction mesurés (hors cache) depuis le démarrage, pour estimer le débit
+_measured = {"files": 0, "seconds": 0.0}
+# Les sessions Streamlit tournent chacune dans son propre thread : état du module modifié sous verrou
+_lock = threading.Lock()
+
+def process_context():
+    # Les processus fils ne sont jamais copiés par fork depuis le serveur Streamlit multithreadé (ils hériteraient
+    # de verrous tenus par d'autres threads) : ils sont créés par un serveur dédié, qui a déjà chargé les modules
+    # d'extraction et d'écriture, ou démarrés à neuf là où forkserver n'existe pas (Windows)
+    method = config.POOL_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(["pipeline", "multi_client"])
+    return context
+
+def _init_worker(settings):
+    # Réglages du processus parent (options de la ligne de commande, tests) repris dans le processus fils
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+def process_pool(max_workers):
+    settings = {name: value for name, value in vars(config).items() if name.isupper()}
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=process_context(),
+                               initializer=_init_worker, initargs=(settings,))
+
+def shared_pool(max_workers=None):
+    # Pool de processus commun aux sessions de l'application
+    global _shared_pool
+    with _lock:
+        if _shared_pool is None:
+            _shared_pool = process_pool(resolve_workers(max_workers))
+        return _shared_pool
+
+def discard_pool(pool):
+    # Pool cassé par la mort d'un processus fils : le prochain appel à shared_pool en crée un neuf
+    global _shared_pool
+    with _lock:
+        if _shared_pool is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+class SharedPool:
+    # Interface submit / map du pool partagé ; un pool cassé est remplacé au moment de soumettre. La mort d'un
+    # processus fils fait échouer les tâches en cours de toutes les sessions : IncrementalReport les soumet à nouveau.
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def submit(self, fn, *args):
+        return self._call(lambda pool: pool.submit(fn, *args))
+
+    def map(self, fn, *iterables, chunksize=1):
+        iterables = [list(iterable) for iterable in iterables]
+        return self._call(lambda pool: pool.map(fn, *iterables, chunksize=chunksize))
+
+    def _call(self, operation):
+        pool = shared_pool(self.max_workers)
+        try:
+            return operation(pool)
+        except BrokenProcessPool:
+            discard_pool(pool)
+            return operation(shared_pool(self.max_workers))
+
+def record_throughput(metrics):
+    if metrics and metrics.get("outcome") in ("ok", "fallback"):
+        with _lock:
+            _measured["files"] += 1
+            _measured["seconds"] += metrics["total_ms"] / 1000
+
+def seconds_per_file():
+    with _lock:
+        files, seconds = _measured["files"], _measured["seconds"]
+    if files:
+        return seconds / files
+    return config.ESTIMATED_FILE_SECONDS
+
+def upload_limit(max_workers=None):
+    # Nombre maximal de PDF par analyse : fixé dans la configuration, sinon déduit du débit mesuré
+    # pour que l'extraction tienne dans UPLOAD_TIME_BUDGET_S
+    if config.MAX_UPLOAD_FILES:
+        return config.MAX_UPLOAD_FILES
+    return max(1, int(config.UPLOAD_TIME_BUDGET_S * resolve_workers(max_workers) / seconds_per_file()))
+
+def file_metrics(name, outcome, record=None, **fields):
+    metrics = dict(record) if record else {"event": "file", "timings_ms": {}, "total_ms": 0.0}
+    metrics.update(name=name, outcome=outcome, **fields)
+    return metrics
+
+def file_result(name, data=None, error=None, metrics=None, cached=False, duplicate=False):
+    # Résultat d'un fichier tel que le reçoivent l'application, le traitement par lot et la base
+    return {"name": name, "data": data, "error": error, "cached": cached, "duplicate": duplicate, "metrics": metrics}
+
+class ContentExtraction:
+    # Règles communes aux traitements qui identifient les fichiers par l'empreinte de leur contenu (lot en mémoire,
+    # envois de l'application, chemins) : reprise depuis le cache d'extraction, une seule analyse par contenu,
+    # erreur d'une tâche rapportée à son seul fichier
+    def __init__(self, period, cache=None):
+        self.period = period
+        self.cache = cache
+
+    def plan(self, digests, running=(), completed=None):
+        # Pour chaque empreinte, dans l'ordre : ("duplicate", None) si le même contenu est déjà en cours (running)
+        # ou à analyser plus haut dans la liste, ("duplicate", résultat) s'il a déjà été analysé (completed :
+        # {empreinte: résultat}, utile surtout sans cache d'extraction), ("cache", données), sinon ("extract", None)
+        planned = set(running)
+        completed = completed or {}
+        actions = []
+        for digest in digests:
+            if digest in planned:
+                actions.append(("duplicate", None))
+                continue
+            if digest in completed:
+                actions.append(("duplicate", completed[digest]))
+                continue
+            data = self.cache.get(cache_key(digest, self.period)) if self.cache is not None else None
+            if data is not None:
+                actions.append(("cache", data))
+            else:
+                planned.add(digest)
+                actions.append(("extract", None))
+        return actions
+
+    def from_cache(self, name, data):
+        return file_result(name, data, metrics=file_metrics(name, "cache"), cached=True)
+
+    def finish(self, name, digest, extracted):
+        # extracted : résultat de extract_one, ou exception de la tâche (processus fils tombé : mémoire, segfault...).
+        # Un résultat valide est mis en cache.
+        if isinstance(extracted, BaseException):
+            return self.failed(name, extracted)
+        if self.cache is not None and extracted["error"] is None:
+            self.cache.put(cache_key(digest, self.period), extracted["data"])
+        return file_result(name, extracted["data"], extracted["error"], dict(extracted["metrics"], name=name))
+
+    @staticmethod
+    def duplicate(name, result):
+        return file_result(name, dict(result["data"]) if result["data"] is not None else None, result["error"],
+                           file_metrics(name, "duplicate"), cached=result["cached"], duplicate=True)
+
+    @staticmethod
+    def failed(name, error):
+        if isinstance(error, BaseException):
+            error = f"{type(error).__name__}: {error}"
+        return file_result(name, error=error, metrics=file_metrics(name, "error", error=error))
+
+def extract_one(name, content, period):
+    # Exécuté dans un processus fils. content : contenu du fichier (enveloppé sans copie dans un fichier en
+    # mémoire portant le nom d'origine) ou chemin d'un fichier sur disque, lu à la demande par le moteur PDF
+    if isinstance(content, (str, os.PathLike)):
+        source, size = os.fspath(content), os.path.getsize(content)
+    else:
+        source, size = io.BytesIO(content), len(content)
+        source.name = name
+    with trace("file") as file_trace:
+        try:
+            data, _ = extract_data_from_pdf(source, period=period)
+            error = None
+        except Exception as e:
+            data, error = None, f"{type(e).__name__}: {e}"
+    if error:
+        metrics = file_metrics(name, "error", file_trace.record(), error=error)
+    else:
+        metrics = file_metrics(name, "fallback" if data.get("Repli") else "ok", file_trace.record(),
+                                backend=data.get("Moteur"), size_bytes=size)
+    return {"name": name, "data": data, "error": error, "metrics": metrics}
+
+def spill_upload(content):
+    # Copie un envoi volumineux dans un fichier temporaire : le processus fils l'ouvre par son chemin au lieu
+    # de recevoir tout le contenu par le canal du pool. À supprimer avec discard_spill une fois l'analyse finie.
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=config.UPLOAD_SPILL_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+def discard_spill(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def read_upload(pdf_file):
+    # Accepte un UploadedFile Streamlit, un fichier ouvert ou un chemin. getvalue() d'un BytesIO construit
+    # sur des octets renvoie ces mêmes octets, sans copie (getbuffer() ou read() après écriture en feraient une).
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return os.path.basename(pdf_file), f.read()
+    if hasattr(pdf_file, "getvalue"):
+        content = pdf_file.getvalue()
+    else:
+        pdf_file.seek(0)
+        content = pdf_file.read()
+    return getattr(pdf_file, "name", "document.pdf"), content
+
+def extract_sequential(pdf_files, period=None):
+    results = []
+    for pdf_file in pdf_files:
+        name, content = read_upload(pdf_file)
+        results.append(extract_one(name, content, period))
+    return results
+
+def _outcome(future):
+    # Résultat de la tâche ou exception qu'elle a levée, pour ContentExtraction.finish
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+def _run_pool(jobs, period, workers):
+    if workers == 1:
+        return [extract_one(name, content, period) for name, content in jobs]
+    with process_pool(workers) as executor:
+        futures = [executor.submit(extract_one, name, content, period) for name, content in jobs]
+        return [_outcome(future) for future in futures]
+
+def extract_batch(pdf_files, period=None, max_workers=None, cache=None, use_cache=True):
+    # Les résultats sont renvoyés dans l'ordre d'entrée ; un fichier en erreur n'interrompt pas le lot
+    if cache is None and use_cache:
+        cache = get_default_cache()
+    extraction = ContentExtraction(period, cache)
+    uploads = [read_upload(pdf_file) for pdf_file in pdf_files]
+    digests = [content_hash(content) for _, content in uploads]
+    actions = extraction.plan(digests)
+
+    jobs = [upload for upload, (action, _) in zip(uploads, actions) if action == "extract"]
+    extracted = iter(_run_pool(jobs, period, resolve_workers(max_workers, len(jobs))))
+    results = []
+    by_digest = {}
+    for (name, _), digest, (action, data) in zip(uploads, digests, actions):
+        if action == "cache":
+            result = extraction.from_cache(name, data)
+        elif action == "extract":
+            result = by_digest[digest] = extraction.finish(name, digest, next(extracted))
+        else:
+            result = extraction.duplicate(name, by_digest[digest])
+        results.append(result)
+    for result in results:
+        emit(result["metrics"])
+        record_throughput(result["metrics"])
+    return results
+
+def _extract_path(path, period, use_cache):
+    # Exécuté dans un processus fils : le fichier est lu, haché puis analysé sans transiter par le processus parent.
+    # Au-delà de UPLOAD_SPILL_BYTES, il est haché par blocs et analysé depuis le disque sans être chargé en entier.
+    try:
+        if os.path.getsize(path) > config.UPLOAD_SPILL_BYTES:
+            content, digest = path, file_hash(path)
+        else:
+            with open(path, "rb") as f:
+                content = f.read()
+            digest = content_hash(content)
+    except OSError as e:
+        return dict(ContentExtraction.failed(path, e), digest=None)
+    extraction = ContentExtraction(period, get_default_cache() if use_cache else None)
+    action, data = extraction.plan([digest])[0]
+    if action == "cache":
+        result = extraction.from_cache(path, data)
+    else:
+        result = extraction.finish(path, digest, extract_one(path, content, period))
+    result["digest"] = digest
+    return result
+
+def iter_extract_paths(paths, period=None, max_workers=None, use_cache=True, max_pending=None):
+    # Extraction en flux d'un itérable de chemins : au plus max_pending fichiers en cours, résultats dans l'ordre
+    workers = resolve_workers(max_workers)
+    if workers == 1:
+        for path in paths:
+            result = _extract_path(path, period, use_cache)
+            emit(result["metrics"])
+            yield result
+        return
+    max_pending = max_pending or workers * 4
+    with process_pool(workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(_extract_path, path, period, use_cache)))
+            if len(pending) >= max_pending:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+
+def _collect(path, future):
+    result = _outcome(future)
+    if isinstance(result, BaseException):
+        result = dict(ContentExtraction.failed(path, result), digest=None)
+    emit(result["metrics"])
+    return result
+
+def add_to_aggregate(data_par_produit, data):
+    # Cumule un résultat d'extraction dans data_par_produit[produit][annee] ; renvoie False si produit ou année manquant
+    produit = data.get("Produit concerné")
+    annee = data.get("Année")
+    if not produit or not annee:
+        return False
+    if produit not in data_par_produit:
+        data_par_produit[produit] = {}
+    if annee not in data_par_produit[produit]:
+        data_par_produit[produit][annee] = {"RC": 0, "Tonnage": 0, "CA": 0}
+    data_par_produit[produit][annee]["RC"] += data.get("RC", 0)
+    data_par_produit[produit][annee]["Tonnage"] += data.get("Tonnage", 0)
+    data_par_produit[produit][annee]["CA"] += data.get("CA", 0.0)
+    return True
+
+def client_key(data):
+    # Même règle que validate_client_info : nom du client et ensemble des comptes
+    return data.get("Nom du client", ""), tuple(sorted(data.get("Comptes clients", [])))
+
+def backend_summary(results):
+    # Répartition des fichiers par moteur et taux de repli sur pdfplumber
+    counts = {}
+    fallbacks = 0
+    extracted = [result["data"] for result in results if result["data"] is not None]
+    for data in extracted:
+        backend = data.get("Moteur", "pdfplumber")
+        counts[backend] = counts.get(backend, 0) + 1
+        if data.get("Repli"):
+            fallbacks += 1
+    return {
+        "backends": counts,
+        "fallbacks": fallbacks,
+        "fallback_rate": fallbacks / len(extracted) if extracted else 0.0,
+    }
+
+def compare_with_sequential(pdf_files, period=None, max_workers=None):
+    start = time.perf_counter()
+    sequential = extract_sequential(pdf_files, period)
+    sequential_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = extract_batch(pdf_files, period, max_workers, use_cache=False)
+    parallel_time = time.perf_counter() - start
+    if [r["data"] for r in sequential] != [r["data"] for r in parallel]:
+        raise RuntimeError("Les résultats parallèles diffèrent des résultats séquentiels.")
+    return {
+        "files": len(pdf_files),
+        "workers": resolve_workers(max_workers, len(pdf_files)),
+        "sequential_s": sequential_time,
+        "parallel_s": parallel_time,
+        "speedup": sequential_time / parallel_time if parallel_time else float("inf"),
+    }
+
+if __name__ == "__main__":
+    # Usage : python pipeline.py "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024" fichier1.pdf fichier2.pdf ...
+    if len(sys.argv) < 3:
+        print("Usage : python pipeline.py <période> <fichier.pdf> [...]")
+        sys.exit(1)
+    report = compare_with_sequential(sys.argv[2:], period=sys.argv[1])
+    print(f"{report['files']} fichiers, {report['workers']} processus")
+    print(f"Séquentiel : {report['sequential_s']:.2f} s")
+    print(f"Parallèle  : {report['parallel_s']:.2f} s")
+    print(f"Gain       : x{report['speedup']:.2f}")
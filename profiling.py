@@ -0,0 +1,170 @@
+# profiling.py
+import argparse
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import config
+from instrumentation import trace, stage, emit, profiled
+
+# Profilage à la demande d'un traitement complet (mode PDF ou addition) : le traitement est rejoué dans le
+# processus courant, sans pool ni cache, sous cProfile. Chaque étape de instrumentation.stage() a son propre
+# profil, ce qui donne les fonctions les plus coûteuses par étape ; le profil complet est enregistré au format
+# .prof (pstats), lisible avec snakeviz ou tout outil de flame graph acceptant ce format.
+
+OUTSIDE_STAGES = "hors étape"
+
+class StageProfiler:
+    # Un cProfile.Profile par étape ; seul celui de l'étape en cours est actif
+    def __init__(self):
+        self.profiles = {}
+        self.stack = []
+
+    def enter(self, name):
+        if self.stack:
+            self.profiles[self.stack[-1]].disable()
+        self.stack.append(name)
+        self.profiles.setdefault(name, cProfile.Profile()).enable()
+
+    def exit(self):
+        self.profiles[self.stack.pop()].disable()
+        if self.stack:
+            self.profiles[self.stack[-1]].enable()
+
+    def start(self):
+        self.enter(OUTSIDE_STAGES)
+
+    def stop(self):
+        self.exit()
+
+    def stats(self, name=None):
+        # pstats.Stats de l'étape (ou de l'ensemble) ; None si rien n'a été mesuré
+        stats = None
+        for stage_name, profile in self.profiles.items():
+            if name is not None and stage_name != name:
+                continue
+            try:
+                profile_stats = pstats.Stats(profile)
+            except TypeError:
+                # Profil vide
+                continue
+            if stats is None:
+                stats = profile_stats
+            else:
+                stats.add(profile_stats)
+        return stats
+
+    def dump(self):
+        # Contenu du fichier .prof (même format que pstats.Stats.dump_stats)
+        stats = self.stats()
+        return marshal.dumps(stats.stats if stats is not None else {})
+
+    def hot_functions(self, limit=None):
+        # [{"stage", "function", "calls", "own_ms", "cumulative_ms"}] : par étape, les fonctions au temps propre le plus élevé
+        limit = limit or config.PROFILE_TOP_FUNCTIONS
+        rows = []
+        for name in self.profiles:
+            stats = self.stats(name)
+            if stats is None:
+                continue
+            entries = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+            for (filename, line, function), (_, calls, own, cumulative, _) in entries:
+                rows.append({
+                    "stage": name,
+                    "function": function_label(filename, line, function),
+                    "calls": calls,
+                    "own_ms": round(own * 1000, 3),
+                    "cumulative_ms": round(cumulative * 1000, 3),
+                })
+        return rows
+
+    def summary(self, limit=None):
+        # Texte du résumé par étape, pour la console ou le fichier joint au profil
+        lines = []
+        stage_name = None
+        for row in self.hot_functions(limit):
+            if row["stage"] != stage_name:
+                stage_name = row["stage"]
+                lines.append(f"[{stage_name}]")
+            lines.append(f"  {row['own_ms']:10.1f} ms  {row['cumulative_ms']:10.1f} ms  {row['calls']:>8}  {row['function']}")
+        return "\n".join(lines)
+
+def function_label(filename, line, function):
+    # Chemin raccourci : à partir du paquet installé (pdfminer, openpyxl...) ou nom du module de l'application
+    if filename == "~":
+        return function
+    path = filename.replace("\\", "/")
+    if "site-packages/" in path:
+        path = path.split("site-packages/", 1)[1]
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{line}({function})"
+
+def profile_pdf(files, period):
+    # Traitement PDF rejoué dans ce processus : extraction de chaque fichier, agrégation, un classeur par client.
+    # files : fichiers envoyés ou chemins. Renvoie (profileur, enregistrement des temps).
+    from pipeline import read_upload, extract_one
+    from records import RecordTable
+    from multi_client import client_jobs
+    from template_writer import generate_report
+    profiler = StageProfiler()
+    with trace("profile", pipeline="pdf", files=len(files)) as run_trace, profiled(profiler):
+        results = []
+        for pdf_file in files:
+            if isinstance(pdf_file, (str, os.PathLike)):
+                results.append(extract_one(os.path.basename(pdf_file), pdf_file, period))
+            else:
+                results.append(extract_one(*read_upload(pdf_file), period))
+        with stage("aggregation"):
+            records = RecordTable.from_records(result["data"] for result in results if result["error"] is None)
+            totals = records.by_client()
+        for _, client_info, client_totals in client_jobs(totals, period):
+            generate_report(client_totals, client_info, use_cache=False)
+    record = run_trace.record()
+    record["errors"] = sum(1 for result in results if result["error"])
+    emit(record)
+    return profiler, record
+
+def profile_addition(files):
+    # Addition rejouée dans ce processus (lecture des classeurs comprise). Renvoie (profileur, enregistrement).
+    from excel_reader import combined_report
+    profiler = StageProfiler()
+    with trace("profile", pipeline="addition", files=len(files)) as run_trace, profiled(profiler):
+        combined_report(files)
+    record = run_trace.record()
+    emit(record)
+    return profiler, record
+
+def write_profile(profiler, path):
+    # Écrit le profil (.prof) et le résumé par étape (.txt) ; renvoie les deux chemins
+    base = path[:-5] if path.endswith(".prof") else path
+    if os.path.dirname(base):
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+    with open(base + ".prof", "wb") as f:
+        f.write(profiler.dump())
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(profiler.summary() + "\n")
+    return base + ".prof", base + ".txt"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profil d'un traitement (PDF ou addition) : fonctions les plus coûteuses par étape.")
+    parser.add_argument("pipeline", choices=("pdf", "addition"), help="Traitement profilé")
+    parser.add_argument("files", nargs="+", help="PDF (pdf) ou classeurs préremplis (addition)")
+    parser.add_argument("--period", default=None, help='Période du traitement PDF, ex. "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024"')
+    parser.add_argument("--output", default="profil", help="Fichiers écrits : <output>.prof et <output>.txt (défaut : profil)")
+    parser.add_argument("--top", type=int, default=None, help="Fonctions retenues par étape (défaut : config.PROFILE_TOP_FUNCTIONS)")
+    args = parser.parse_args(argv)
+    if args.pipeline == "pdf":
+        if not args.period:
+            parser.error("--period est requis pour le traitement PDF")
+        profiler, record = profile_pdf(args.files, args.period)
+    else:
+        profiler, record = profile_addition(args.files)
+    print(profiler.summary(args.top))
+    prof_path, summary_path = write_profile(profiler, args.output)
+    print(f"Total : {record['total_ms']:.1f} ms — profil : {prof_path}, résumé : {summary_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# records.py
+import numpy as np
+import config
+
+# Table en colonnes des résultats d'extraction (un enregistrement par fichier ou par ligne de classeur) :
+# client, comptes, produit, année et les valeurs RC, Tonnage, CA. Les cumuls par groupe sont calculés en une
+# passe vectorisée (np.unique + np.bincount), dans l'ordre d'ajout des enregistrements comme les cumuls par +=.
+
+KEY_COLUMNS = ("client", "accounts", "product", "year")
+VALUE_FIELDS = ("RC", "Tonnage", "CA")
+
+def _number(value):
+    try:
+        return 0.0 if value is None else float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def accounts_key(accounts):
+    # Même règle que client_key : ensemble trié des comptes
+    return ", ".join(sorted(accounts or []))
+
+class RecordTable:
+    def __init__(self):
+        self._rows = {name: [] for name in KEY_COLUMNS + VALUE_FIELDS}
+        self._columns = None
+
+    def __len__(self):
+        return len(self._rows["product"])
+
+    def append(self, data):
+        # Ajoute un résultat d'extraction ; renvoie False (sans l'ajouter) si le produit ou l'année manque
+        produit = data.get("Produit concerné")
+        annee = data.get("Année")
+        if not produit or not annee:
+            return False
+        rows = self._rows
+        rows["client"].append(data.get("Nom du client", "") or "")
+        rows["accounts"].append(accounts_key(data.get("Comptes clients", [])))
+        rows["product"].append(produit)
+        rows["year"].append(str(annee))
+        for field in VALUE_FIELDS:
+            rows[field].append(_number(data.get(field, 0)))
+        self._columns = None
+        return True
+
+    def extend(self, records):
+        return sum(1 for data in records if not self.append(data))
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        table.extend(records)
+        return table
+
+    def columns(self):
+        # Colonnes NumPy, reconstruites seulement après un ajout
+        if self._columns is None:
+            self._columns = {name: np.array(self._rows[name], dtype=str) for name in KEY_COLUMNS}
+            self._columns.update({field: np.array(self._rows[field], dtype=np.float64) for field in VALUE_FIELDS})
+        return self._columns
+
+    def group_sum(self, by=("product", "year")):
+        # {clé de groupe (tuple): {"RC": ..., "Tonnage": ..., "CA": ...}}
+        if not len(self):
+            return {}
+        columns = self.columns()
+        levels = []
+        codes = []
+        for name in by:
+            uniques, inverse = np.unique(columns[name], return_inverse=True)
+            levels.append(uniques.tolist())
+            codes.append(inverse.ravel())
+        shape = tuple(len(level) for level in levels)
+        groups, group_ids = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+        group_ids = group_ids.ravel()
+        sums = {field: np.bincount(group_ids, weights=columns[field], minlength=len(groups)).tolist()
+                for field in VALUE_FIELDS}
+        positions = np.unravel_index(groups, shape)
+        result = {}
+        for idx in range(len(groups)):
+            key = tuple(level[position[idx]] for level, position in zip(levels, positions))
+            result[key] = {field: sums[field][idx] for field in VALUE_FIELDS}
+        return result
+
+    def by_client(self):
+        # Cumuls produit/année de chaque client (nom, comptes) en une seule passe
+        clients = {}
+        for (client, accounts, produit, annee), values in self.group_sum(KEY_COLUMNS).items():
+            key = (client, tuple(accounts.split(", ")) if accounts else ())
+            clients.setdefault(key, {})[(produit, annee)] = values
+        return clients
+
+    def to_data_par_produit(self):
+        return nested_totals(self.group_sum())
+
+def nested_totals(totals):
+    # {(produit, année): valeurs} -> data_par_produit[produit][année]
+    data_par_produit = {}
+    for (produit, annee), values in totals.items():
+        data_par_produit.setdefault(produit, {})[annee] = {
+            "RC": int(values["RC"]), "Tonnage": values["Tonnage"], "CA": values["CA"]}
+    return data_par_produit
+
+def product_year_totals(data):
+    # Cumuls par (produit, année) depuis une RecordTable, un dict déjà indexé par (produit, année)
+    # ou la structure imbriquée data_par_produit[produit][année]
+    if isinstance(data, RecordTable):
+        return data.group_sum()
+    if data and all(isinstance(key, tuple) for key in data):
+        return data
+    return {(produit, annee): values for produit, annees in data.items() for annee, values in annees.items()}
+
+def structure_values(data, date_N_1, date_N):
+    # (cellule, valeur) des tableaux RC / Tonnage / CA du template, dans l'ordre de get_excel_structure
+    totals = product_year_totals(data)
+    return [(cell, totals.get((produit, annee), {}).get(tableau, 0))
+            for tableau, annee, produit, cell in config.structure_cells(date_N_1, date_N)]
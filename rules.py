@@ -0,0 +1,104 @@
+# rules.py
+import re
+import string
+import config
+
+# Compilation des règles déclarées dans config.EXTRACTION_RULES : expressions régulières précompilées
+# et tables de correspondance pour les en-têtes et les produits, construites une seule fois à l'import.
+
+class CompiledRules:
+    def __init__(self, rules, product_mapping, tonnage_fields):
+        self.client_name = [re.compile(pattern, re.IGNORECASE) for pattern in rules["client_name"]]
+        self.accounts = [re.compile(pattern, re.IGNORECASE) for pattern in rules["accounts"]]
+        self.account_number = re.compile(rules["account_number"])
+        self.product = [re.compile(pattern, re.IGNORECASE) for pattern in rules["product"]]
+        self.product_key_words = rules["product_key_words"]
+        self.product_mapping = dict(product_mapping)
+        self.month_table_header = rules["month_table_header"].lower()
+        self.year = re.compile(rules["year"])
+        self.total_markers = tuple(marker.lower() for marker in rules["total_markers"])
+        self.total_re = re.compile("|".join(re.escape(marker) for marker in self.total_markers), re.IGNORECASE)
+        self.default_tonnage_field = rules["default_tonnage_field"]
+        self.tonnage_fields = {produit: field.lower() for produit, field in tonnage_fields.items()}
+
+        # Une seule expression pour tous les alias d'en-têtes, utilisée comme filtre avant la recherche par champ
+        self.header_aliases = {field: tuple(alias.lower() for alias in aliases)
+                               for field, aliases in rules["header_aliases"].items()}
+        self.header_re = re.compile("|".join(
+            re.escape(alias) for aliases in self.header_aliases.values() for alias in aliases))
+        # Les en-têtes se répètent d'un fichier à l'autre : le résultat de la recherche est mémorisé
+        self._header_memo = {}
+
+    def _first(self, patterns, text, pos=0):
+        for pattern in patterns:
+            match = pattern.search(text, pos)
+            if match:
+                return match
+        return None
+
+    def find_client_name(self, text):
+        match = self._first(self.client_name, text)
+        return match.group(1).strip() if match else ''
+
+    def find_accounts(self, text):
+        # Renvoie la liste des comptes et la position de fin du bloc (None si absent)
+        match = self._first(self.accounts, text)
+        if not match:
+            return [], None
+        return self.account_number.findall(match.group(1)), match.end()
+
+    def product_key(self, label):
+        return ' '.join(label.split()[:self.product_key_words]).strip().lower().strip(string.punctuation)
+
+    def find_product(self, text, pos=0):
+        # Renvoie la clé produit lue dans le texte (ou None) et le produit correspondant de PRODUCT_MAPPING
+        match = self._first(self.product, text, pos)
+        if not match:
+            return None, None
+        key = self.product_key(match.group(1).strip())
+        return key, self.product_mapping.get(key)
+
+    def is_month_table(self, table):
+        return bool(table) and any(header and self.month_table_header in header.lower() for header in table[0])
+
+    def header_fields(self, header):
+        # Champs (RC, CA...) reconnus dans un libellé d'en-tête, hors tonnage
+        fields = self._header_memo.get(header)
+        if fields is None:
+            header_clean = header.strip().lower()
+            fields = tuple(field for field, aliases in self.header_aliases.items()
+                           if any(alias in header_clean for alias in aliases)) if self.header_re.search(header_clean) else ()
+            if len(self._header_memo) > 4096:
+                self._header_memo.clear()
+            self._header_memo[header] = fields
+        return fields
+
+    def map_headers(self, headers, produit):
+        tonnage_field = self.tonnage_fields.get(produit, self.default_tonnage_field.lower())
+        header_map = {}
+        for idx, header in enumerate(headers):
+            if header:
+                for field in self.header_fields(header):
+                    header_map[field] = idx
+                if header.strip().lower() == tonnage_field:
+                    header_map['Tonnage'] = idx
+        return header_map
+
+    def is_total(self, label):
+        return bool(label) and self.total_re.search(label) is not None
+
+    def is_total_prefix(self, label):
+        return label.strip().lower().startswith(self.total_markers)
+
+    def find_year(self, label):
+        match = self.year.search(label)
+        return match.group(1) if match else None
+
+def compile_rules(rules=None, product_mapping=None, tonnage_fields=None):
+    return CompiledRules(
+        rules or config.EXTRACTION_RULES,
+        product_mapping or config.PRODUCT_MAPPING,
+        tonnage_fields or config.PRODUCT_TONNAGE_FIELD,
+    )
+
+RULES = compile_rules()
@@ -0,0 +1,178 @@
+# store.py
+import os
+import sqlite3
+import threading
+import time
+import config
+from records import RecordTable, accounts_key, VALUE_FIELDS
+
+# Base SQLite locale des chiffres extraits : un enregistrement par PDF (empreinte du contenu), indexé par client,
+# compte, produit et année. Un rapport peut ensuite être produit pour n'importe quelle période à partir de la base,
+# sans renvoyer ni réanalyser les PDF.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    digest TEXT PRIMARY KEY,
+    source TEXT NOT NULL DEFAULT '',
+    client TEXT NOT NULL,
+    accounts TEXT NOT NULL,
+    product TEXT NOT NULL,
+    year TEXT NOT NULL,
+    rc REAL NOT NULL,
+    tonnage REAL NOT NULL,
+    ca REAL NOT NULL,
+    backend TEXT,
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_client ON records (client, accounts, product, year);
+CREATE INDEX IF NOT EXISTS records_product_year ON records (product, year);
+CREATE TABLE IF NOT EXISTS record_accounts (
+    digest TEXT NOT NULL REFERENCES records (digest) ON DELETE CASCADE,
+    account TEXT NOT NULL,
+    PRIMARY KEY (account, digest)
+);
+"""
+
+def period_years(period):
+    # Années N-1 et N d'une période "Du mm/aaaa au mm/aaaa et du mm/aaaa au mm/aaaa"
+    parts = period.split()
+    if len(parts) < 9:
+        raise ValueError("Format de période invalide.")
+    return parts[1].split("/")[1], parts[8].split("/")[1]
+
+class RecordStore:
+    def __init__(self, path=None):
+        self.path = path or config.RECORD_STORE_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # Une seule connexion pour les sessions et le traitement par lot : le verrou couvre chaque lecture jusqu'au
+        # fetchall (_query) et la transaction d'enregistrement de add_many
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if self.path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _query(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def add(self, digest, data, source=""):
+        # Enregistre (ou remplace) le résultat d'un fichier ; renvoie False si le produit ou l'année manque
+        return self.add_many([(digest, data, source)]) == 1
+
+    def add_many(self, items):
+        # items : (empreinte, données extraites, nom du fichier) ; une seule transaction pour tout le lot.
+        # L'année enregistrée est celle du rapport (tableau des mois), pas celle de la période de l'extraction :
+        # un rapport reçu en retard reste rattaché à son année.
+        rows = []
+        accounts = []
+        now = time.time()
+        for digest, data, source in items:
+            produit = data.get("Produit concerné")
+            annee = data.get("Année du rapport") or data.get("Année")
+            if not produit or not annee:
+                continue
+            values = [float(data.get(field) or 0) for field in VALUE_FIELDS]
+            rows.append((digest, source or "", data.get("Nom du client", "") or "",
+                         accounts_key(data.get("Comptes clients", [])), produit, str(annee), *values,
+                         data.get("Moteur"), now))
+            accounts.extend((digest, account) for account in sorted(set(data.get("Comptes clients") or [])))
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM record_accounts WHERE digest = ?", [(row[0],) for row in rows])
+            self.conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.executemany("INSERT OR IGNORE INTO record_accounts VALUES (?, ?)", accounts)
+        return len(rows)
+
+    def _where(self, client=None, accounts=None, account=None, products=None, years=None):
+        clauses = []
+        params = []
+        if client is not None:
+            clauses.append("client = ?")
+            params.append(client)
+        if accounts is not None:
+            clauses.append("accounts = ?")
+            params.append(accounts_key(accounts))
+        if account is not None:
+            clauses.append("digest IN (SELECT digest FROM record_accounts WHERE account = ?)")
+            params.append(account)
+        for column, values in (("product", products), ("year", years)):
+            if values is not None:
+                values = [str(value) for value in values]
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def totals(self, client=None, accounts=None, account=None, products=None, years=None):
+        # {(produit, année): {"RC", "Tonnage", "CA"}} cumulés par SQLite, sur les index
+        where, params = self._where(client, accounts, account, products, years)
+        query = f"SELECT product, year, SUM(rc), SUM(tonnage), SUM(ca) FROM records{where} GROUP BY product, year"
+        return {(produit, annee): dict(zip(VALUE_FIELDS, values))
+                for produit, annee, *values in self._query(query, params)}
+
+    def records(self, client=None, accounts=None, account=None, products=None, years=None):
+        # Enregistrements correspondants, sous forme de RecordTable (ordre d'enregistrement)
+        where, params = self._where(client, accounts, account, products, years)
+        query = f"SELECT client, accounts, product, year, rc, tonnage, ca FROM records{where} ORDER BY stored_at, rowid"
+        return RecordTable.from_records(
+            {"Nom du client": client_name, "Comptes clients": accounts_value.split(", ") if accounts_value else [],
+             "Produit concerné": produit, "Année": annee, "RC": rc, "Tonnage": tonnage, "CA": ca}
+            for client_name, accounts_value, produit, annee, rc, tonnage, ca in self._query(query, params))
+
+    def clients(self):
+        # [(nom du client, comptes, nombre de fichiers, années)]
+        query = ("SELECT client, accounts, COUNT(*), GROUP_CONCAT(DISTINCT year) FROM records "
+                 "GROUP BY client, accounts ORDER BY client, accounts")
+        return [(client_name, tuple(accounts.split(", ")) if accounts else (), count, sorted((years or "").split(",")))
+                for client_name, accounts, count, years in self._query(query)]
+
+    def report(self, client_name, accounts, period):
+        # Classeur du client pour la période, directement depuis la base
+        from template_writer import generate_report
+        client_info = {"Nom du client": client_name, "Comptes clients": list(accounts), "Périodicité": period}
+        return generate_report(self.totals(client_name, accounts, years=period_years(period)), client_info)
+
+    def delete(self, digests):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM records WHERE digest = ?", [(digest,) for digest in digests])
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_default_store(create=True):
+    # create=False pour une simple consultation : None tant que la base n'a pas été créée, sans créer le fichier
+    global _default_store
+    if not config.RECORD_STORE_PATH:
+        return None
+    with _default_lock:
+        if _default_store is None:
+            if not create and not os.path.exists(config.RECORD_STORE_PATH):
+                return None
+            _default_store = RecordStore()
+        return _default_store
+
+if __name__ == "__main__":
+    # Usage : python store.py                                    — liste les clients enregistrés
+    #         python store.py "<client>" "<période>" [comptes...] — écrit le rapport du client pour la période
+    import sys
+    store = get_default_store(create=False)
+    if store is None:
+        print("Aucune base : désactivée (config.RECORD_STORE_PATH) ou pas encore créée.")
+        sys.exit(1)
+    if len(sys.argv) < 3:
+        for client_name, accounts, count, years in store.clients():
+            print(f"{client_name} [{', '.join(accounts)}] : {count} fichiers, années {', '.join(years)}")
+        sys.exit(0)
+    from multi_client import output_filename
+    client_name, period, accounts = sys.argv[1], sys.argv[2], sys.argv[3:]
+    start = time.perf_counter()
+    content = store.report(client_name, accounts, period)
+    path = output_filename(client_name, accounts)
+    with open(path, "wb") as f:
+        f.write(content)
+    print(f"{path} écrit en {(time.perf_counter() - start) * 1000:.1f} ms")
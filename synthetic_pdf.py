@@ -0,0 +1,140 @@
+# synthetic_pdf.py
+import os
+import random
+import config
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# Génération de PDF "Analyse des ventes par client" synthétiques pour les mesures de performance :
+# tous les produits de PRODUCT_MAPPING, libellé de tonnage propre à chaque produit, plusieurs années
+# et tableaux des mois de grande taille. Les valeurs attendues sont renvoyées avec chaque fichier.
+
+GENERATOR_VERSION = 2
+CLIENTS = ["TRANSPORTS MARTIN", "LOGISTIQUE DUPONT & FILS", "SOCIETE DES VINS DU SUD", "ATELIERS BERNARD"]
+COLUMN_WIDTHS = [90, 60, 60, 70, 90]
+ROW_HEIGHT = 16
+
+def _amount(value):
+    return f"{value:.2f}".replace('.', ',')
+
+def product_label(key, rnd):
+    # Libellé tel qu'imprimé dans le rapport : la clé de PRODUCT_MAPPING suivie d'un complément
+    return f"{key.title()} {rnd.choice(['Express', 'Standard', 'Messagerie', 'J+1'])}"
+
+def tonnage_label(key):
+    produit = config.PRODUCT_MAPPING[key]
+    return config.PRODUCT_TONNAGE_FIELD.get(produit, config.EXTRACTION_RULES["default_tonnage_field"])
+
+def month_rows(year, months, rnd, history_years=0):
+    # Lignes du tableau des mois : éventuellement précédées d'années hors période (tableaux longs)
+    periods = [(y, m) for y in range(year - 1 - history_years, year - 1) for m in range(1, 13)]
+    periods += [(year, m) for m in range(1, months + 1)]
+    rows = []
+    totals = [0, 0, 0]
+    for y, m in periods:
+        rc = rnd.randint(1, 500)
+        tonnage = round(rnd.uniform(1, 900), 2)
+        ca = round(rnd.uniform(100, 90000), 2)
+        totals[0] += rc
+        totals[1] += tonnage
+        totals[2] += ca
+        rows.append([f"{m:02d}/{y}", str(rc), "0", _amount(tonnage), _amount(ca)])
+    total_row = ["Totaux", str(totals[0]), "0", _amount(totals[1]), _amount(totals[2])]
+    return rows, total_row
+
+def _draw_table(page, table, x0, y0):
+    xs = [x0]
+    for width in COLUMN_WIDTHS:
+        xs.append(xs[-1] + width)
+    for i, row in enumerate(table):
+        for j, cell in enumerate(row):
+            page.insert_text((xs[j] + 3, y0 + i * ROW_HEIGHT + 12), cell, fontsize=8)
+    for i in range(len(table) + 1):
+        page.draw_line((xs[0], y0 + i * ROW_HEIGHT), (xs[-1], y0 + i * ROW_HEIGHT))
+    for x in xs:
+        page.draw_line((x, y0), (x, y0 + len(table) * ROW_HEIGHT))
+
+def make_report_pdf(client, comptes, key, year, months=12, history_years=0, rows_per_page=None, repeat_header=True, seed=0,
+                    table_offset=(0, 0)):
+    # Renvoie le contenu du PDF et les valeurs que l'extraction doit retrouver.
+    # Avec rows_per_page, le tableau des mois se poursuit sur les pages suivantes (en-tête répété ou non).
+    # table_offset : décalage (x, y) en points du titre et du tableau de la première page, pour une mise en page
+    # différente sur un même format de page.
+    if pymupdf is None:
+        raise ImportError("PyMuPDF est requis pour générer les PDF synthétiques.")
+    rnd = random.Random(seed)
+    rows, total_row = month_rows(year, months, rnd, history_years)
+    label = product_label(key, rnd)
+    headers = ["Mois", "Nb RC", "Poids", tonnage_label(key), "CA HT facturé"]
+    body = rows + [total_row]
+    chunks = [body[i:i + rows_per_page] for i in range(0, len(body), rows_per_page)] if rows_per_page else [body]
+
+    doc = pymupdf.open()
+    for number, chunk in enumerate(chunks):
+        table = [headers] + chunk if number == 0 or repeat_header else chunk
+        page = doc.new_page(width=842, height=max(595, 160 + len(table) * ROW_HEIGHT))
+        if number == 0:
+            page.insert_text((40, 40), f"Analyse des ventes par client {client} 05/01/{year + 1}", fontsize=11)
+            page.insert_text((40, 60), f"Compte(s) : [{', '.join(comptes)}]", fontsize=9)
+            page.insert_text((40, 75), f"Produit(s) : [{label}]", fontsize=9)
+            dx, dy = table_offset
+            page.insert_text((40 + dx, 95 + dy), "Analyse par mois de transport", fontsize=10)
+            _draw_table(page, table, 40 + dx, 105 + dy)
+        else:
+            _draw_table(page, table, 40, 40)
+    content = doc.tobytes()
+    doc.close()
+
+    expected = {
+        "Nom du client": client,
+        "Comptes clients": list(comptes),
+        "Produit concerné": config.PRODUCT_MAPPING[key],
+        "Année": str(year),
+        "RC": int(total_row[1]),
+        "Tonnage": float(total_row[3].replace(',', '.')),
+        "CA": float(total_row[4].replace(',', '.')),
+    }
+    return content, expected
+
+def corpus_period(year=2024):
+    return f"Du 01/{year - 1} au 12/{year - 1} et du 01/{year} au 12/{year}"
+
+def iter_corpus(count, seed=0, year=2024):
+    # Fichiers (nom, contenu, attendu) : les produits et les années tournent, un fichier sur dix a un tableau long,
+    # réparti sur plusieurs pages une fois sur deux
+    keys = list(config.PRODUCT_MAPPING)
+    rnd = random.Random(seed)
+    accounts = {client: [str(rnd.randint(100000, 999999)) for _ in range(rnd.randint(1, 3))] for client in CLIENTS}
+    for idx in range(count):
+        client = CLIENTS[idx % len(CLIENTS)]
+        key = keys[idx % len(keys)]
+        report_year = year - (idx // len(keys)) % 2
+        history_years = 3 if idx % 10 == 9 else 0
+        rows_per_page = 20 if idx % 20 == 19 else None
+        content, expected = make_report_pdf(client, accounts[client], key, report_year, history_years=history_years,
+                                            rows_per_page=rows_per_page, repeat_header=idx % 40 == 19,
+                                            seed=seed * 100003 + idx)
+        yield f"synthetique_{idx:05d}.pdf", content, expected
+
+def write_corpus(directory, count, seed=0, year=2024):
+    # Écrit les PDF dans le répertoire et renvoie [(chemin, attendu)]
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for name, content, expected in iter_corpus(count, seed, year):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        files.append((path, expected))
+    return files
+
+if __name__ == "__main__":
+    # Usage : python synthetic_pdf.py <répertoire> [nombre] — écrit un jeu de PDF synthétiques
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage : python synthetic_pdf.py <répertoire> [nombre]")
+        sys.exit(1)
+    files = write_corpus(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 12)
+    print(f"{len(files)} fichiers écrits dans {sys.argv[1]} — période : {corpus_period()}")
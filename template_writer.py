@@ -0,0 +1,417 @@
+# template_writer.py
+import io
+import os
+import posixpath
+import re
+import threading
+import zipfile
+from functools import lru_cache
+from xml.sax.saxutils import escape
+import config
+from cache import file_hash, report_key, get_report_cache
+from instrumentation import stage
+from records import structure_values
+from excel_generator import TEMPLATE_PATH, coerce_cell_value, load_template_workbook, fill_excel_workbook
+
+# Écrit les rapports en modifiant directement le XML de la feuille dans une copie en mémoire du template,
+# sans recharger ni resérialiser le classeur avec openpyxl. Le résultat relu par openpyxl est identique
+# à celui de fill_excel_workbook (formules conservées, valeurs en cache supprimées comme le fait openpyxl).
+# openpyxl n'est importé qu'à la compilation du template (ou pour le repli) : le démarrage de l'application n'en dépend pas.
+
+CELL_RE = re.compile(r'<c r="([A-Z]+\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+ROW_RE = re.compile(r'<row r="(\d+)"([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+MERGE_RE = re.compile(r'<mergeCell ref="([^"]+)"/>')
+SLOT = "\x00{}\x00"
+# Caractères de contrôle refusés par Excel (même expression que openpyxl.cell.cell.ILLEGAL_CHARACTERS_RE)
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+# À incrémenter lorsqu'une modification de l'écriture change les classeurs produits (clé du cache des classeurs)
+WRITER_VERSION = 2
+
+def zip_options(level=None):
+    # Arguments de zipfile.ZipFile : 0 = parties stockées sans compression
+    if level == 0:
+        return {"compression": zipfile.ZIP_STORED}
+    return {"compression": zipfile.ZIP_DEFLATED, "compresslevel": level}
+
+def template_version(path=TEMPLATE_PATH):
+    # Empreinte du template, recalculée seulement si le fichier a changé
+    stat = os.stat(path)
+    return _template_digest(path, stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=4)
+def _template_digest(path, mtime_ns, size):
+    return file_hash(path)[:16]
+
+def _cell_sort_key(ref):
+    from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+    column, row = coordinate_from_string(ref)
+    return row, column_index_from_string(column)
+
+def _strip_cached_value(match):
+    # openpyxl ne conserve pas les valeurs calculées des formules : Excel les recalcule à l'ouverture
+    ref, attrs, inner = match.group(1), match.group(2), match.group(3)
+    if inner is None or "<f" not in inner:
+        return match.group(0)
+    attrs = re.sub(r'\s+t="[^"]*"', "", attrs)
+    inner = re.sub(r'<v>.*?</v>', "", inner, flags=re.S)
+    return f'<c r="{ref}"{attrs}>{inner}</c>'
+
+def _ensure_cell(sheet_xml, ref):
+    # Ajoute une cellule vide (et sa ligne si besoin) lorsque la cible n'existe pas dans le template
+    if re.search(f'<c r="{ref}"[ />]', sheet_xml):
+        return sheet_xml
+    row_number = _cell_sort_key(ref)[0]
+    new_cell = f'<c r="{ref}"/>'
+    row_match = next((m for m in ROW_RE.finditer(sheet_xml) if int(m.group(1)) == row_number), None)
+    if row_match is None:
+        new_row = f'<row r="{row_number}">{new_cell}</row>'
+        following = next((m for m in ROW_RE.finditer(sheet_xml) if int(m.group(1)) > row_number), None)
+        if following is not None:
+            return sheet_xml[:following.start()] + new_row + sheet_xml[following.start():]
+        if "<sheetData/>" in sheet_xml:
+            return sheet_xml.replace("<sheetData/>", f"<sheetData>{new_row}</sheetData>")
+        return sheet_xml.replace("</sheetData>", new_row + "</sheetData>")
+    row_attrs, row_inner = row_match.group(2), row_match.group(3) or ""
+    cells = [m.group(0) for m in CELL_RE.finditer(row_inner)] + [new_cell]
+    cells.sort(key=lambda cell: _cell_sort_key(CELL_RE.match(cell).group(1)))
+    new_row = f'<row r="{row_number}"{row_attrs}>{"".join(cells)}</row>'
+    return sheet_xml[:row_match.start()] + new_row + sheet_xml[row_match.end():]
+
+def _render_cell(ref, style, value):
+    style_attr = f' s="{style}"' if style else ""
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    text = ILLEGAL_CHARACTERS_RE.sub("", str(value))
+    if not text:
+        # Comme openpyxl : cellule texte sans contenu, relue comme vide
+        return f'<c r="{ref}"{style_attr} t="inlineStr"/>'
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+def find_sheet_path(read, sheet_name):
+    # read : fonction renvoyant le contenu d'une partie de l'archive à partir de son nom
+    workbook_xml = read("xl/workbook.xml").decode("utf-8")
+    sheet = re.search(f'<sheet [^>]*name="{re.escape(escape(sheet_name))}"[^>]*r:id="([^"]+)"', workbook_xml)
+    if sheet is None:
+        raise ValueError(f"La feuille '{sheet_name}' est manquante.")
+    rels = read("xl/_rels/workbook.xml.rels").decode("utf-8")
+    target = re.search(f'<Relationship [^>]*Id="{sheet.group(1)}"[^>]*Target="([^"]+)"', rels)
+    if target is None:
+        target = re.search(f'<Relationship [^>]*Target="([^"]+)"[^>]*Id="{sheet.group(1)}"', rels)
+    path = target.group(1).lstrip("/")
+    return path if path.startswith("xl/") else f"xl/{path}"
+
+def report_cells(period_str):
+    # Toutes les cellules écrites par fill_excel_workbook, dans l'ordre d'écriture
+    parts = period_str.split()
+    if len(parts) < 9:
+        raise ValueError("Format de période invalide.")
+    date_N_1, date_N = parts[1], parts[8]
+    cells = [config.GLOBAL_FIELDS[field] for field in ("Nom du client", "Comptes clients", "Périodicité")]
+    cells += [cell for cell, _ in config.header_values(date_N_1, date_N)]
+    cells += [cell for _, _, _, cell in config.structure_cells(date_N_1, date_N)]
+    return cells
+
+class CompiledTemplate:
+    def __init__(self, template_path=TEMPLATE_PATH, sheet_name=None, targets=None, compress_level=None):
+        from openpyxl.utils.cell import coordinate_from_string, column_index_from_string, get_column_letter, range_boundaries
+        sheet_name = sheet_name or config.EXCEL_SHEET_NAME
+        with zipfile.ZipFile(template_path) as archive:
+            entries = [(info, archive.read(info.filename)) for info in archive.infolist()]
+        contents = {info.filename: data for info, data in entries}
+        self.sheet_name = sheet_name
+        self.compress_level = compress_level
+        self.zip_options = zip_options(compress_level)
+        self.sheet_path = find_sheet_path(contents.__getitem__, sheet_name)
+        # Parties d'origine conservées pour les classeurs à plusieurs feuilles (render_workbook)
+        self.contents = contents
+
+        sheet_xml = contents[self.sheet_path].decode("utf-8")
+        sheet_xml = CELL_RE.sub(_strip_cached_value, sheet_xml)
+
+        # Correspondance cellule -> cellule d'ancrage de la plage fusionnée, calculée une seule fois
+        self.anchors = {}
+        merged = [range_boundaries(ref) for ref in MERGE_RE.findall(sheet_xml)]
+        for ref in targets or report_cells("Du 01/2000 au 12/2000 et du 01/2001 au 12/2001"):
+            column, row = coordinate_from_string(ref)
+            col = column_index_from_string(column)
+            self.anchors[ref] = ref
+            for min_col, min_row, max_col, max_row in merged:
+                if min_col <= col <= max_col and min_row <= row <= max_row:
+                    self.anchors[ref] = f"{get_column_letter(min_col)}{min_row}"
+                    break
+
+        # Découpage du XML en segments fixes autour des cellules cibles
+        self.styles = {}
+        self.originals = {}
+        slots = sorted(set(self.anchors.values()), key=_cell_sort_key)
+        for ref in slots:
+            sheet_xml = _ensure_cell(sheet_xml, ref)
+        for ref in slots:
+            match = re.search(f'<c r="{ref}"([^>]*?)(?:/>|>(.*?)</c>)', sheet_xml, re.S)
+            style = re.search(r'\bs="(\d+)"', match.group(1))
+            self.styles[ref] = style.group(1) if style else None
+            self.originals[ref] = match.group(0)
+            sheet_xml = sheet_xml[:match.start()] + SLOT.format(ref) + sheet_xml[match.end():]
+        pieces = sheet_xml.split("\x00")
+        self.chunks = pieces[0::2]
+        self.slot_order = pieces[1::2]
+
+        workbook_xml = contents["xl/workbook.xml"].decode("utf-8")
+        if "fullCalcOnLoad" not in workbook_xml:
+            workbook_xml = re.sub(r'<calcPr\b', '<calcPr fullCalcOnLoad="1"', workbook_xml, count=1)
+        self.workbook_xml = workbook_xml.encode("utf-8")
+
+        # Archive de base contenant toutes les parties inchangées, déjà compressées
+        base = io.BytesIO()
+        with zipfile.ZipFile(base, "w", **self.zip_options) as archive:
+            for info, data in entries:
+                if info.filename in (self.sheet_path, "xl/workbook.xml"):
+                    continue
+                archive.writestr(info.filename, data)
+        self.base_archive = base.getvalue()
+
+    def render_sheet(self, values):
+        # values : {cellule: valeur} ou liste de (cellule, valeur) dans l'ordre d'écriture ; les cellules fusionnées sont redirigées vers leur ancre
+        by_anchor = {}
+        for ref, value in (values.items() if isinstance(values, dict) else values):
+            by_anchor[self.anchors[ref]] = coerce_cell_value(value)
+        parts = [self.chunks[0]]
+        for ref, chunk in zip(self.slot_order, self.chunks[1:]):
+            if ref in by_anchor:
+                parts.append(_render_cell(ref, self.styles[ref], by_anchor[ref]))
+            else:
+                parts.append(self.originals[ref])
+            parts.append(chunk)
+        return "".join(parts).encode("utf-8")
+
+    def render(self, values):
+        sheet_xml = self.render_sheet(values)
+        output = io.BytesIO(self.base_archive)
+        output.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(output, "a", **self.zip_options) as archive:
+            archive.writestr("xl/workbook.xml", self.workbook_xml)
+            archive.writestr(self.sheet_path, sheet_xml)
+        return output.getvalue()
+
+    def render_workbook(self, sheets):
+        # Un classeur avec une copie de la feuille par élément de sheets = [(nom, valeurs)] ; chaque copie
+        # a ses propres dessins et graphiques, dont les références pointent vers sa feuille
+        contents = dict(self.contents)
+        content_types = contents["[Content_Types].xml"].decode("utf-8")
+        workbook_xml = self.workbook_xml.decode("utf-8")
+        workbook_rels = contents["xl/_rels/workbook.xml.rels"].decode("utf-8")
+        sheet_tag = re.search(r'<sheet [^>]*/>', workbook_xml).group(0)
+        sheet_ids = [int(value) for value in re.findall(r'sheetId="(\d+)"', workbook_xml)]
+        tree = _part_tree(contents, self.sheet_path)
+        old_ref = _sheet_ref(self.sheet_name)
+
+        sheet_tags = []
+        for index, (name, values) in enumerate(sheets):
+            if index == 0:
+                # Première feuille : mêmes parties et mêmes identifiants que le template (calcChain reste valable)
+                renamed = {part: part for part in tree}
+                sheet_tags.append(re.sub(r'name="[^"]*"', lambda _: f'name="{_attr(name)}"', sheet_tag))
+            else:
+                renamed = {part: _free_part_name(contents, part) for part in tree}
+                new_rel_id = f"rIdSheet{index + 1}"
+                sheet_tags.append(f'<sheet name="{_attr(name)}" sheetId="{max(sheet_ids) + index}" r:id="{new_rel_id}"/>')
+                target = posixpath.relpath(renamed[self.sheet_path], "xl")
+                workbook_rels = workbook_rels.replace("</Relationships>",
+                    f'<Relationship Id="{new_rel_id}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="{target}"/></Relationships>')
+            for part, new_part in renamed.items():
+                if part == self.sheet_path:
+                    data = self.render_sheet(values)
+                    if index > 0:
+                        # Une seule feuille sélectionnée à l'ouverture (sinon Excel les groupe)
+                        data = data.replace(b' tabSelected="1"', b"", 1)
+                else:
+                    data = self.contents[part]
+                    if part.startswith("xl/charts/chart"):
+                        data = data.replace(escape(old_ref).encode("utf-8"), escape(_sheet_ref(name)).encode("utf-8"))
+                contents[new_part] = data
+                rels = _rels_path(part)
+                if rels in self.contents:
+                    contents[_rels_path(new_part)] = _retarget(self.contents[rels], part, new_part, renamed)
+                if new_part != part:
+                    override = re.search(f'<Override PartName="/{re.escape(part)}" ContentType="([^"]+)"/>', content_types)
+                    if override:
+                        content_types = content_types.replace("</Types>",
+                            f'<Override PartName="/{new_part}" ContentType="{override.group(1)}"/></Types>')
+
+        workbook_xml = re.sub(r'<sheets>.*?</sheets>', lambda _: f"<sheets>{''.join(sheet_tags)}</sheets>", workbook_xml, flags=re.S)
+        contents["xl/workbook.xml"] = workbook_xml.encode("utf-8")
+        contents["xl/_rels/workbook.xml.rels"] = workbook_rels.encode("utf-8")
+        contents["[Content_Types].xml"] = content_types.encode("utf-8")
+        if "docProps/app.xml" in contents:
+            contents["docProps/app.xml"] = _app_properties(contents["docProps/app.xml"].decode("utf-8"),
+                                                           [name for name, _ in sheets]).encode("utf-8")
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", **self.zip_options) as archive:
+            for filename, data in contents.items():
+                archive.writestr(filename, data)
+        return output.getvalue()
+
+def _app_properties(app_xml, sheet_names):
+    # docProps/app.xml : nombre de feuilles (premier groupe de HeadingPairs, celui des feuilles de calcul) et leurs
+    # noms en tête de TitlesOfParts ; les titres suivants (plages nommées...) sont conservés
+    pairs = re.search(r'<HeadingPairs>.*?</HeadingPairs>', app_xml, re.S)
+    titles = re.search(r'<TitlesOfParts><vt:vector size="\d+" baseType="lpstr">(.*?)</vt:vector></TitlesOfParts>', app_xml, re.S)
+    if not pairs or not titles:
+        return app_xml
+    counts = re.findall(r'<vt:i4>(\d+)</vt:i4>', pairs.group(0))
+    if not counts:
+        return app_xml
+    entries = re.findall(r'<vt:lpstr>.*?</vt:lpstr>', titles.group(1), re.S)[int(counts[0]):]
+    entries = [f"<vt:lpstr>{escape(name)}</vt:lpstr>" for name in sheet_names] + entries
+    new_pairs = re.sub(r'<vt:i4>\d+</vt:i4>', f"<vt:i4>{len(sheet_names)}</vt:i4>", pairs.group(0), count=1)
+    new_titles = f'<TitlesOfParts><vt:vector size="{len(entries)}" baseType="lpstr">{"".join(entries)}</vt:vector></TitlesOfParts>'
+    return app_xml[:pairs.start()] + new_pairs + app_xml[pairs.end():titles.start()] + new_titles + app_xml[titles.end():]
+
+def _rels_path(part):
+    return posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+
+def _attr(value):
+    return escape(value, {'"': "&quot;"})
+
+def _resolve(part, target):
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+def _retarget(rels, part, new_part, renamed):
+    # Relations d'une partie copiée : les cibles copiées avec elle pointent vers leurs nouvelles copies
+    def replace(match):
+        path = _resolve(part, match.group(1))
+        if path not in renamed:
+            return match.group(0)
+        return f'Target="{posixpath.relpath(renamed[path], posixpath.dirname(new_part))}"'
+    return re.sub(r'Target="([^"]+)"', replace, rels.decode("utf-8")).encode("utf-8")
+
+def _part_tree(contents, root):
+    # Parties propres à une feuille (dessins, graphiques, styles de graphiques, paramètres d'impression) ;
+    # les images sont partagées entre les copies
+    tree = [root]
+    for part in tree:
+        rels = contents.get(_rels_path(part))
+        if rels is None:
+            continue
+        for target in re.findall(r'Target="([^"]+)"', rels.decode("utf-8")):
+            path = _resolve(part, target)
+            if path in contents and not path.startswith("xl/media/") and path not in tree:
+                tree.append(path)
+    return tree
+
+def _free_part_name(contents, part):
+    # chart3.xml -> chartN.xml avec N libre dans le même répertoire
+    stem, ext = posixpath.splitext(part)
+    prefix = stem.rstrip("0123456789")
+    number = 1
+    while f"{prefix}{number}{ext}" in contents:
+        number += 1
+    name = f"{prefix}{number}{ext}"
+    contents[name] = b""
+    return name
+
+def _sheet_ref(sheet_name):
+    # Référence de feuille telle qu'écrite dans les formules des graphiques : 'Nom'!
+    return "'" + sheet_name.replace("'", "''") + "'!"
+
+def report_values(data_par_produit, client_info):
+    # Mêmes cellules et mêmes valeurs que fill_excel_workbook, dans le même ordre
+    period_str = client_info.get("Périodicité", "")
+    parts = period_str.split()
+    if len(parts) < 9:
+        raise ValueError("Format de période invalide.")
+    date_N_1 = parts[1]
+    date_N   = parts[8]
+    comptes = client_info.get("Comptes clients", [])
+    values = [
+        (config.GLOBAL_FIELDS["Nom du client"], client_info.get("Nom du client", "")),
+        (config.GLOBAL_FIELDS["Comptes clients"], ", ".join(comptes) if comptes else ""),
+        (config.GLOBAL_FIELDS["Périodicité"], period_str),
+    ]
+    values += config.header_values(date_N_1, date_N)
+    values += structure_values(data_par_produit, date_N_1, date_N)
+    return values
+
+_compiled_template = None
+_compiled_lock = threading.Lock()
+
+def get_compiled_template():
+    # Compilé une seule fois, même si plusieurs sessions demandent leur premier rapport en même temps ;
+    # le modèle compilé n'est ensuite plus modifié et se partage sans verrou. Recompilé si le niveau de
+    # compression configuré change.
+    global _compiled_template
+    template = _compiled_template
+    if template is None or template.compress_level != config.REPORT_COMPRESS_LEVEL:
+        with _compiled_lock:
+            template = _compiled_template
+            if template is None or template.compress_level != config.REPORT_COMPRESS_LEVEL:
+                template = _compiled_template = CompiledTemplate(compress_level=config.REPORT_COMPRESS_LEVEL)
+    return template
+
+def output_key(kind, values):
+    # Clé du cache des classeurs : valeurs écrites (chiffres, client, période), template, écriture et compression
+    return report_key(kind, WRITER_VERSION, template_version(), config.COMPILED_TEMPLATE_WRITER, config.REPORT_COMPRESS_LEVEL,
+                      values)
+
+def generate_report(data_par_produit, client_info, cache=None, use_cache=True):
+    # Renvoie le contenu .xlsx du rapport ; un rapport identique déjà produit est repris du cache des classeurs
+    cache = (cache if cache is not None else get_report_cache()) if use_cache else None
+    if cache is None:
+        return _generate_report(data_par_produit, client_info)
+    with stage("fill"):
+        values = report_values(data_par_produit, client_info)
+    with stage("report_cache"):
+        key = output_key("report", values)
+        content = cache.get(key)
+    if content is None:
+        content = _generate_report(data_par_produit, client_info, values)
+        cache.put(key, content)
+    return content
+
+def _generate_report(data_par_produit, client_info, values=None):
+    # Repli sur openpyxl si l'écriture compilée est désactivée
+    if not config.COMPILED_TEMPLATE_WRITER:
+        with stage("template_load"):
+            wb = load_template_workbook()
+        with stage("fill"):
+            wb = fill_excel_workbook(wb, data_par_produit, client_info)
+        with stage("save"):
+            buffer = io.BytesIO()
+            wb.save(buffer)
+        return buffer.getvalue()
+    with stage("template_load"):
+        template = get_compiled_template()
+    if values is None:
+        with stage("fill"):
+            values = report_values(data_par_produit, client_info)
+    with stage("save"):
+        return template.render(values)
+
+if __name__ == "__main__":
+    # Compare les temps de génération avec fill_excel_workbook (l'équivalence est vérifiée par test_template_writer.py)
+    import time
+    data_par_produit = {
+        "Premium France": {"2024": {"RC": 120, "Tonnage": 350.5, "CA": 15230.75}, "2023": {"RC": 98, "Tonnage": 280.2, "CA": 12040.1}},
+        "Direct Inter": {"2024": {"RC": 12, "Tonnage": 40.0, "CA": 2200.0}},
+    }
+    client_info = {"Nom du client": "Client <test> & fils", "Comptes clients": ["123456", "789012"],
+                   "Périodicité": "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024"}
+    n = 50
+    start = time.perf_counter()
+    for _ in range(n):
+        wb = fill_excel_workbook(load_template_workbook(), data_par_produit, client_info)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+    openpyxl_time = (time.perf_counter() - start) / n
+    get_compiled_template()
+    start = time.perf_counter()
+    for _ in range(n):
+        get_compiled_template().render(report_values(data_par_produit, client_info))
+    compiled_time = (time.perf_counter() - start) / n
+    print(f"openpyxl : {openpyxl_time * 1000:.1f} ms/rapport")
+    print(f"compilé  : {compiled_time * 1000:.1f} ms/rapport (x{openpyxl_time / compiled_time:.0f})")
@@ -0,0 +1,96 @@
+# test_extraction.py
+import io
+import pytest
+import extraction
+from instrumentation import trace
+from synthetic_pdf import make_report_pdf, corpus_period
+
+# Extraction des rapports synthétiques avec chaque moteur : repli sur pdfplumber quand le moteur rapide échoue,
+# tableau des mois poursuivi sur plusieurs pages, zones d'intérêt apprises puis reprises ou réapprises.
+
+pytest.importorskip("pymupdf")
+pytest.importorskip("pdfplumber")
+
+PERIOD = corpus_period()
+BACKENDS = extraction.available_backends()
+VALUES = ("Nom du client", "Comptes clients", "Produit concerné", "Année", "RC", "Tonnage", "CA")
+
+@pytest.fixture(autouse=True)
+def _fresh_regions(monkeypatch):
+    # Zones d'intérêt apprises propres à chaque test
+    monkeypatch.setattr(extraction, "_learned_regions", {})
+
+def _report(**options):
+    return make_report_pdf("TRANSPORTS MARTIN", ["123456"], "premium 13", 2024, seed=7, **options)
+
+def _extract(content, backend):
+    data, _ = extraction.extract_data_from_pdf(io.BytesIO(content), period=PERIOD, backend=backend)
+    return data
+
+def _extract_traced(content, backend):
+    # Données extraites et issue de la lecture par zones d'intérêt ("hit", "miss", None sans zones connues)
+    with trace("file") as file_trace:
+        data = _extract(content, backend)
+    return data, file_trace.fields.get("roi")
+
+def _values(data):
+    return {key: data.get(key) for key in VALUES}
+
+def test_fast_backend_error_falls_back_to_pdfplumber(monkeypatch):
+    # Détection des tableaux de PyMuPDF en échec sur ce fichier, comme sur un PDF qu'il ne sait pas lire
+    def broken_find_tables(page, *args, **kwargs):
+        raise RuntimeError("find_tables")
+    monkeypatch.setattr(extraction.pymupdf.Page, "find_tables", broken_find_tables)
+    content, expected = _report()
+    data = _extract(content, "pymupdf")
+    assert _values(data) == expected
+    assert data["Moteur"] == "pdfplumber"
+    assert data["Repli"] is True
+
+@pytest.mark.parametrize("repeat_header", [True, False])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_month_table_continues_on_next_pages(backend, repeat_header):
+    # 24 mois et la ligne de totaux répartis sur trois pages, en-tête répété ou non
+    content, expected = _report(history_years=1, rows_per_page=10, repeat_header=repeat_header)
+    with extraction.pymupdf.open(stream=content, filetype="pdf") as doc:
+        assert doc.page_count == 3
+    data = _extract(content, backend)
+    assert _values(data) == expected
+    assert (data["Moteur"], data["Repli"]) == (backend, False)
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_continuation_skips_repeated_header(backend):
+    # Une seule ligne d'en-tête dans le tableau reconstitué
+    content, _ = _report(history_years=1, rows_per_page=10, repeat_header=True)
+    text, table = extraction.BACKENDS[backend](io.BytesIO(content))
+    assert sum(1 for row in table if extraction.is_month_table([row])) == 1
+    assert extraction.has_total_row(table)
+    assert len(table) == 1 + 24 + 1
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_learned_regions_are_reused(backend):
+    data, roi = _extract_traced(_report()[0], backend)
+    assert roi is None
+    assert list(extraction._learned_regions) == ["842x595"]
+    content, expected = make_report_pdf("ATELIERS BERNARD", ["654321"], "direct inter", 2023, seed=8)
+    data, roi = _extract_traced(content, backend)
+    assert _values(data) == expected
+    assert roi == "hit"
+
+@pytest.mark.parametrize("offset, outcome", [((150, 0), "miss"), ((300, 0), "miss"), ((0, 150), "hit")])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_table_moved_from_learned_region(backend, offset, outcome):
+    # Même format de page, tableau déplacé : coupé par la zone apprise (lecture pleine page et zones réapprises)
+    # ou toujours dedans
+    _extract(_report()[0], backend)
+    learned = extraction._learned_regions["842x595"]
+    content, expected = make_report_pdf("ATELIERS BERNARD", ["654321"], "direct inter", 2023, seed=8,
+                                        table_offset=offset)
+    data, roi = _extract_traced(content, backend)
+    assert _values(data) == expected
+    assert (data["Moteur"], data["Repli"]) == (backend, False)
+    assert roi == outcome
+    relearned = extraction._learned_regions["842x595"]
+    assert (relearned != learned) == (outcome == "miss")
+    if outcome == "miss":
+        assert relearned["table"][0] >= learned["table"][0] + offset[0] - 1
@@ -0,0 +1,27 @@
+# test_shared_pool.py
+import pytest
+import cache
+import config
+import store
+
+# Sessions simultanées sur le pool partagé : la mort d'un processus fils au milieu d'un envoi ne doit coûter aucun
+# fichier, ni à la session qui l'a provoquée ni aux autres, et les envois suivants passent par le pool reconstruit.
+
+pytest.importorskip("pymupdf")
+
+@pytest.fixture
+def isolated_storage(tmp_path, monkeypatch):
+    # Cache et base propres au test, comme dans load_test.main
+    monkeypatch.setattr(config, "EXTRACTION_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(config, "RECORD_STORE_PATH", str(tmp_path / "records.sqlite3"))
+    monkeypatch.setattr(cache, "_default_cache", None)
+    monkeypatch.setattr(store, "_default_store", None)
+    yield
+    if store._default_store is not None:
+        store._default_store.close()
+
+def test_sessions_recover_from_worker_death(isolated_storage):
+    from load_test import run_load_test, check_store
+    result = run_load_test(sessions=3, rounds=2, nb_files=4, kill_worker=True, log=lambda *_: None)
+    assert result["failures"] == []
+    assert check_store(store.get_default_store(), 3, 2, 4) == []
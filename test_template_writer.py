@@ -0,0 +1,100 @@
+# test_template_writer.py
+import io
+import warnings
+import zipfile
+from xml.etree import ElementTree
+import pytest
+import config
+from excel_generator import load_template_workbook, fill_excel_workbook
+from template_writer import CompiledTemplate, find_sheet_path, report_values
+
+# L'écriture compilée doit produire le même classeur que fill_excel_workbook : mêmes valeurs de cellules
+# (formules comprises) et, relue puis réenregistrée par openpyxl, exactement le même XML de feuille.
+
+openpyxl = pytest.importorskip("openpyxl")
+
+PERIOD = "Du 01/2023 au 12/2023 et du 01/2024 au 12/2024"
+
+CASES = {
+    "deux_produits": (
+        {"Premium France": {"2024": {"RC": 120, "Tonnage": 350.5, "CA": 15230.75},
+                            "2023": {"RC": 98, "Tonnage": 280.2, "CA": 12040.1}},
+         "Direct Inter": {"2024": {"RC": 12, "Tonnage": 40.0, "CA": 2200.0}}},
+        {"Nom du client": "Client <test> & fils", "Comptes clients": ["123456", "789012"], "Périodicité": PERIOD},
+    ),
+    "sans_donnees": (
+        {},
+        {"Nom du client": "", "Comptes clients": [], "Périodicité": PERIOD},
+    ),
+    "texte_a_nettoyer": (
+        {"Premium France": {"2023": {"RC": 1, "Tonnage": 0.4, "CA": 3263263.6799999997}}},
+        {"Nom du client": "  Client \"quoté\" ", "Comptes clients": ["000123"], "Périodicité": PERIOD},
+    ),
+}
+
+def _openpyxl_report(data, client_info):
+    buffer = io.BytesIO()
+    fill_excel_workbook(load_template_workbook(), data, client_info).save(buffer)
+    return buffer.getvalue()
+
+def _resaved(content):
+    buffer = io.BytesIO()
+    openpyxl.load_workbook(io.BytesIO(content)).save(buffer)
+    return buffer.getvalue()
+
+def _sheet_xml(content):
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        return archive.read(find_sheet_path(archive.read, config.EXCEL_SHEET_NAME))
+
+def _cell_values(content, data_only):
+    ws = openpyxl.load_workbook(io.BytesIO(content), data_only=data_only)[config.EXCEL_SHEET_NAME]
+    return {cell.coordinate: cell.value for row in ws.iter_rows() for cell in row if cell.value is not None}
+
+@pytest.fixture(scope="module")
+def compiled():
+    return CompiledTemplate()
+
+@pytest.fixture(autouse=True)
+def _quiet_openpyxl():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        yield
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_cell_values_match_openpyxl(compiled, case):
+    data, client_info = CASES[case]
+    reference = _openpyxl_report(data, client_info)
+    content = compiled.render(report_values(data, client_info))
+    for data_only in (False, True):
+        assert _cell_values(content, data_only) == _cell_values(reference, data_only)
+
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_sheet_xml_matches_openpyxl(compiled, case):
+    data, client_info = CASES[case]
+    reference = _openpyxl_report(data, client_info)
+    content = compiled.render(report_values(data, client_info))
+    assert _sheet_xml(_resaved(content)) == _sheet_xml(reference)
+
+@pytest.mark.parametrize("level", [0, 9])
+def test_compression_level_keeps_content(level):
+    data, client_info = CASES["deux_produits"]
+    values = report_values(data, client_info)
+    default = CompiledTemplate().render(values)
+    content = CompiledTemplate(compress_level=level).render(values)
+    with zipfile.ZipFile(io.BytesIO(default)) as expected, zipfile.ZipFile(io.BytesIO(content)) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == \
+               {name: expected.read(name) for name in expected.namelist()}
+
+def test_workbook_properties_list_client_sheets(compiled):
+    # Classeur à une feuille par client : docProps/app.xml annonce les mêmes feuilles que xl/workbook.xml
+    names = ["Client <A> & fils", "Client B", "Client C"]
+    sheets = [(name, report_values(data, dict(client_info, **{"Nom du client": name})))
+              for name, (data, client_info) in zip(names, CASES.values())]
+    content = compiled.render_workbook(sheets)
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        app = ElementTree.fromstring(archive.read("docProps/app.xml"))
+    ns = {"ep": "http://schemas.openxmlformats.org/officeDocument/2006/extended-properties",
+          "vt": "http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes"}
+    assert [title.text for title in app.findall("ep:TitlesOfParts/vt:vector/vt:lpstr", ns)] == names
+    assert app.find("ep:HeadingPairs/vt:vector/vt:variant/vt:i4", ns).text == str(len(names))
+    assert openpyxl.load_workbook(io.BytesIO(content)).sheetnames == names